@@ -2,44 +2,77 @@ import json
 import sys
 from utils import form_blocks, flatten
 
-def plus_dce(func):
+# Analyses (see lesson6/manager.py) that are still valid after this pass. Deleting instructions never makes the symbol table wrong. 
+PRESERVES = ('symbols',)
+
+# Ops that have a dest but also a side effect: never delete them, even if the dest is unused. 
+SIDE_EFFECT_OPS = 'call',
+
+def plus_dce(func) -> dict:
     # Remove unused insts globally. 
-    trivial_dce(func)
+    stats = trivial_dce(func)
 
     # Optimize locally. 
-    local_dce(func)
-
-
-def trivial_dce(func):
-    # Global analysis
-    used = set()
-
-    remove = True # Flag for remove insts. True if there is a removal in this iteration. If not, the loop is done. 
-    while (remove == True):
-        remove = False
-        used.clear()
-
-        for instr in func['instrs']:
-            if 'args' in instr:
-                # print(instr['args'])
-                for arg in instr['args']:
-                    used.add(arg)
-        # print(used)
-        for instr in func['instrs']:
-            if ('dest' in instr) and (instr['dest'] not in used):
-                func['instrs'].remove(instr) # delete instr in json
-                remove = True
-
-def local_dce(func):
+    stats['removed'] += local_dce(func)
+
+    return stats
+
+
+def removable(instr) -> bool:
+    return 'dest' in instr and instr['op'] not in SIDE_EFFECT_OPS
+
+def trivial_dce(func) -> dict:
+    '''Global analysis: delete every instruction whose dest is never used, until nothing changes. 
+    Instead of rescanning the function each round, keep a use count for each variable and a worklist of dead instructions. 
+    Deleting an instruction decrements the use counts of its args; when a count drops to 0, all the definitions of that variable are dead too. 
+    Every instruction is deleted at most once and every variable hits 0 at most once, so this is linear in the size of the function. 
+
+    Return: dict of stats. `removed`: number of deleted instructions. 
+    '''
+    instrs = func['instrs']
+
+    use_count = dict() # Key: var; Value: number of args (in all instrs) that use it
+    defs = dict() # Key: var; Value: list of indices of the instrs that define it
+    for i, instr in enumerate(instrs):
+        for arg in instr.get('args', []):
+            use_count[arg] = use_count.get(arg, 0) + 1
+        if 'dest' in instr:
+            defs.setdefault(instr['dest'], []).append(i)
+
+    worklist = [i for i, instr in enumerate(instrs) if removable(instr) and use_count.get(instr['dest'], 0) == 0]
+    dead = [False] * len(instrs)
+    removed = 0
+
+    while worklist:
+        i = worklist.pop()
+        if dead[i]:
+            continue
+        dead[i] = True
+        removed += 1
+
+        for arg in instrs[i].get('args', []):
+            use_count[arg] -= 1
+            if use_count[arg] == 0: # arg just became unused: all its definitions are dead
+                worklist.extend(j for j in defs.get(arg, []) if removable(instrs[j]))
+
+    if removed:
+        func['instrs'] = [instr for i, instr in enumerate(instrs) if not dead[i]] # delete instrs in json
+
+    return {'removed': removed}
+
+def local_dce(func) -> int:
     '''Optimize locally: kill the insturction that has unused dest var. 
     last_def: defined but not used. Dict: key: dest var; value: instr. 
     When it is defined again, we delete the instr. 
+    Return: number of deleted instructions. 
     '''
+    removed = 0
     blocks = list(form_blocks(func['instrs']))
 
     for block in blocks:
 
         last_def = dict()
+        dead = set() # indices of the unused instrs; deleted after the scan, so the indices in last_def stay valid
         for i, instr in enumerate(block):
             # check for uses
             for arg in instr.get('args', []):
@@ -48,14 +81,18 @@ def local_dce(func):
             # check for defs
             if 'dest' in instr:
                 dest = instr['dest']
-                if dest in last_def:
-                    block.pop(last_def[dest]) # delete the unused instr
+                if dest in last_def and removable(block[last_def[dest]]):
+                    dead.add(last_def[dest]) # the unused instr
                 last_def[dest] = i # add this instr into last_def
             
             # print(f"Last Def: {last_def}")
         # print(block)
+        if dead:
+            block[:] = [instr for i, instr in enumerate(block) if i not in dead]
+            removed += len(dead)
     
     func['instrs'] = flatten(blocks)
+    return removed
 
 
 MODES = {
@@ -64,14 +101,18 @@ MODES = {
 }
 
 if __name__ == "__main__":
-    if (len(sys.argv) > 1):
+    if (len(sys.argv) > 1) and (sys.argv[1] in MODES):
         dce_func = MODES[sys.argv[1]]
     else:
         dce_func = trivial_dce
 
+    stats = '-s' in sys.argv # print how many instructions were removed
+
     prog = json.load(sys.stdin)
     for func in prog['functions']:
-        dce_func(func)
+        func_stats = dce_func(func)
+        if stats:
+            print(f"{func['name']}: removed {func_stats['removed']}", file=sys.stderr)
 
     # Emit JSON IR
     json.dump(prog, sys.stdout, indent=2)
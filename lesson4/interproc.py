@@ -0,0 +1,283 @@
+import sys
+import json
+import heapq
+from collections import namedtuple
+from utils import form_blocks
+from cfg import CFG, block_map
+from df import Analysis, solve_df, cprop_merge, print_df
+
+# Interprocedural constant propagation with function summaries.
+#
+# df.py analyzes one function at a time: a `call` makes its dest '?', and the args of a
+# function are unknown. Here every function gets a summary:
+# - params: the constant value of each parameter at every call site (merged with cprop_merge).
+# - ret: the constant value the function returns on every path ('?' if it's not a constant).
+# Inside a function, the parameters start with their summary values, and the dest of a
+# `call` gets the callee's `ret`.
+#
+# The functions are visited bottom-up over the strongly connected components of the call
+# graph (callees before callers), so a caller usually sees the final summary of its callees.
+# Within a recursive component, and when new call sites change the params of a callee, the
+# functions are visited again until no summary changes. A function is only re-analyzed
+# when its inputs (its params and the rets of its callees) changed; otherwise its last
+# result is reused.
+
+# The summary of a function.
+# - params: dict. Key: parameter name; Value: constant or '?'. None until a call site was analyzed.
+# - ret: constant or '?'. None if no return value was seen yet.
+Summary = namedtuple('Summary', ['params', 'ret'])
+
+
+def call_graph(prog: dict) -> dict:
+    '''
+    Call graph of a program.
+    Return: dict. Key: function name; Value: list of the functions it calls (in order of first call, no duplicates).
+    '''
+    graph = dict()
+    for func in prog['functions']:
+        callees = list()
+        for instr in func['instrs']:
+            if instr.get('op', None) == 'call':
+                for callee in instr['funcs']:
+                    if callee not in callees:
+                        callees.append(callee)
+        graph[func['name']] = callees
+    return graph
+
+
+def sccs(graph: dict) -> list:
+    '''
+    Strongly connected components of `graph` (Tarjan's algorithm, iterative).
+    Return: list of components (lists of nodes), bottom-up: a component comes after every component it has an edge to.
+    '''
+    index = dict() # node -> DFS number
+    low = dict() # node -> smallest DFS number reachable through the DFS subtree and one back edge
+    on_stack = set()
+    stack = list()
+    components = list()
+
+    for root in graph:
+        if root in index:
+            continue
+        work = [(root, iter(graph[root]))]
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, succs = work[-1]
+            for succ in succs:
+                if succ not in graph: # call to a function that is not in the program
+                    continue
+                if succ not in index:
+                    index[succ] = low[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(graph[succ])))
+                    break
+                if succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+            else: # all the successors of `node` are done
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]: # `node` is the root of a component
+                    component = list()
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+def merge_values(values):
+    '''
+    Merge constants: the value if they are all the same, '?' if not. None (nothing seen yet) is ignored.
+    '''
+    out = None
+    for value in values:
+        if value is None:
+            continue
+        if out is None:
+            out = value
+        elif out != value:
+            return '?'
+    return out
+
+
+def cprop_call_func(block: list, In: dict, rets: dict, visit=None) -> dict:
+    '''
+    Forward Transfer function of the interprocedural constant propagation: like `cprop_func`,
+    but the dest of a `call` gets the `ret` summary of the callee.
+    visit: if given, function(instr, values) called before each instruction, with the values right before it.
+    '''
+    Out = In.copy()
+
+    for instr in block:
+        if visit is not None:
+            visit(instr, Out)
+        if 'dest' in instr:
+            op = instr.get('op', None)
+            if op == 'const':
+                Out[instr['dest']] = instr['value']
+            elif op == 'call':
+                ret = rets.get(instr['funcs'][0], '?')
+                if ret is None: # no return value known yet: undefined, like a variable on a path that doesn't define it
+                    Out.pop(instr['dest'], None)
+                else:
+                    Out[instr['dest']] = ret
+            else:
+                Out[instr['dest']] = '?'
+
+    return Out
+
+
+def analyze_func(func: dict, params: dict, rets: dict, param_names: dict):
+    '''
+    Constant propagation of one function, given the summaries of its params and of the functions it calls.
+    Return: (In, Out, ret, sites)
+        ret: merged value of every `ret` of the function.
+        sites: dict. Key: callee name; Value: the param values of the callee, merged over the call sites in this function.
+    '''
+    cfg = CFG(block_map(list(form_blocks(func['instrs']))))
+    entry = cfg.blocks[cfg.entry]
+
+    def transfer(block, In):
+        if block is entry: # the parameters come in on an extra edge, from the callers
+            In = cprop_merge([params, In])
+        return cprop_call_func(block, In, rets)
+
+    In, Out = solve_df(cfg, Analysis(True, init=dict(), merge=cprop_merge, transfer=transfer))
+    In[cfg.entry] = cprop_merge([params, In[cfg.entry]])
+
+    # walk every block once more to read the values at the `ret` and `call` instructions
+    ret_values = list()
+    site_values = dict() # callee -> list of param value dicts
+    def visit(instr, values):
+        op = instr.get('op', None)
+        if op == 'ret' and instr.get('args'):
+            ret_values.append(values.get(instr['args'][0], None))
+        elif op == 'call':
+            callee = instr['funcs'][0]
+            names = param_names.get(callee, [])
+            site = {name: values[arg] for name, arg in zip(names, instr.get('args', [])) if arg in values}
+            site_values.setdefault(callee, list()).append(site)
+    for label, block in cfg.blocks.items():
+        cprop_call_func(block, In[label], rets, visit)
+
+    sites = {callee: cprop_merge(values) for callee, values in site_values.items()}
+    return In, Out, merge_values(ret_values), sites
+
+
+def interproc_cprop(prog: dict, stats: dict = None) -> dict:
+    '''
+    Interprocedural constant propagation of a whole program.
+
+    Data structures:
+        graph: call graph (see call_graph). callers: dict. Key: function name; Value: set of the functions that call it.
+        summaries: dict. Key: function name; Value: Summary.
+        sites: dict. Key: (caller, callee); Value: the param values of the callee at the call sites in the caller.
+        results: dict. Key: function name; Value: (inputs, In, Out) of its last analysis. `inputs` is what the
+            analysis depends on (its params and the rets of its callees): if they didn't change, the result is reused.
+        worklist: heap of (position of the component in bottom-up order, function name).
+        stats: if given, stats['analyzed'] / stats['reused'] count the functions analyzed / skipped.
+
+    Return: dict. Key: function name; Value: (Summary, In, Out).
+    '''
+    funcs = {func['name']: func for func in prog['functions']}
+    param_names = {name: [arg['name'] for arg in func.get('args', [])] for name, func in funcs.items()}
+    graph = call_graph(prog)
+    callers = {name: set() for name in graph}
+    for name, callees in graph.items():
+        for callee in callees:
+            if callee in callers:
+                callers[callee].add(name)
+
+    position = dict()
+    for i, component in enumerate(sccs(graph)):
+        for name in component:
+            position[name] = i
+
+    # entry points (main, and functions that no other function calls) are called with unknown args
+    entry_points = {name for name in funcs if name == 'main' or not callers[name] - {name}}
+    summaries = dict()
+    for name in funcs:
+        params = {param: '?' for param in param_names[name]} if name in entry_points else None
+        summaries[name] = Summary(params, None)
+
+    sites = dict()
+    results = dict()
+    if stats is not None:
+        stats.update({'analyzed': 0, 'reused': 0})
+
+    worklist = [(position[name], name) for name in funcs]
+    heapq.heapify(worklist)
+    queued = set(funcs)
+    while worklist:
+        _, name = heapq.heappop(worklist)
+        queued.discard(name)
+
+        rets = {callee: summaries[callee].ret for callee in graph[name] if callee in summaries}
+        params = summaries[name].params or dict()
+        inputs = (sorted(params.items(), key=repr), sorted(rets.items(), key=repr))
+        if name in results and results[name][0] == inputs: # nothing it depends on changed
+            if stats is not None:
+                stats['reused'] += 1
+            continue
+
+        In, Out, ret, func_sites = analyze_func(funcs[name], params, rets, param_names)
+        results[name] = (inputs, In, Out)
+        if stats is not None:
+            stats['analyzed'] += 1
+
+        changed = set()
+        if ret != summaries[name].ret:
+            summaries[name] = summaries[name]._replace(ret=ret)
+            changed.update(callers[name])
+        for callee in graph[name]:
+            if callee not in funcs:
+                continue
+            sites[(name, callee)] = func_sites.get(callee, dict())
+            if callee not in entry_points:
+                new_params = cprop_merge(sites[(caller, callee)] for caller in sorted(callers[callee]) if (caller, callee) in sites)
+                if new_params != summaries[callee].params:
+                    summaries[callee] = summaries[callee]._replace(params=new_params)
+                    changed.add(callee)
+        for func_name in changed:
+            if func_name not in queued:
+                heapq.heappush(worklist, (position[func_name], func_name))
+                queued.add(func_name)
+
+    return {name: (summaries[name],) + results[name][1:] for name in funcs}
+
+
+def format_value(value) -> str:
+    if value is None: # nothing known: no call site, or no return value
+        return '∅'
+    return str(value)
+
+
+def print_summary(name: str, summary: Summary, param_names: list):
+    '''
+    Print a summary as `@name(param: value, ...) -> ret`.
+    '''
+    params = summary.params or dict()
+    args = ', '.join(f"{param}: {format_value(params.get(param, None))}" for param in param_names)
+    print(f"@{name}({args}) -> {format_value(summary.ret)}")
+
+
+if __name__ == "__main__":
+    show_stats = '-s' in sys.argv # print how many functions were analyzed / reused
+
+    prog = json.load(sys.stdin)
+    stats = dict()
+    result = interproc_cprop(prog, stats)
+    for func in prog['functions']:
+        summary, In, Out = result[func['name']]
+        print_summary(func['name'], summary, [arg['name'] for arg in func.get('args', [])])
+        print_df(In, Out)
+    if show_stats:
+        print(f"analyzed {stats['analyzed']} functions, reused {stats['reused']} summaries", file=sys.stderr)
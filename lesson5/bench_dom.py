@@ -0,0 +1,111 @@
+import sys
+import time
+import random
+from collections import OrderedDict
+
+from cfg import CFG
+from dom import IDOM_ALGORITHMS
+
+# Benchmark of the immediate dominator algorithms of dom.py on generated CFGs:
+#
+#   python3 bench_dom.py [sizes...]
+#
+# prints the time of each algorithm (best of 3, CFG construction not included) for every shape and size,
+# and checks that they agree.
+
+
+def jmp(label: str) -> dict:
+    return {'op': 'jmp', 'labels': [label]}
+
+def br(then_label: str, else_label: str) -> dict:
+    return {'op': 'br', 'args': ['c'], 'labels': [then_label, else_label]}
+
+
+def chain(n: int, rng: random.Random) -> OrderedDict:
+    '''
+    A chain of n branches: each block goes to the next one, and to a block a few steps ahead (or behind, 20% of the time: loops).
+    Listed in reverse order. Reducible.
+    '''
+    blocks = OrderedDict()
+    blocks['entry'] = [{'label': 'entry'}, jmp('b0')]
+    for i in reversed(range(n)):
+        next_label = f'b{i + 1}' if i + 1 < n else 'exit'
+        if rng.random() < 0.2:
+            other = f'b{max(0, i - rng.randint(1, 5))}'
+        else:
+            other = f'b{min(n - 1, i + rng.randint(1, 5))}'
+        blocks[f'b{i}'] = [{'label': f'b{i}'}, br(next_label, other)]
+    blocks['exit'] = [{'label': 'exit'}, {'op': 'ret', 'args': []}]
+    return blocks
+
+
+def state_machine(n: int, rng: random.Random) -> OrderedDict:
+    '''
+    A flattened state machine with n states: a tree of `br` blocks dispatches to the states, and every state goes back to the
+    dispatcher or jumps straight to another state. The states can be entered at many points: irreducible.
+    '''
+    blocks = OrderedDict()
+    blocks['entry'] = [{'label': 'entry'}, jmp('d1')]
+    # dispatch tree: d_i branches to d_2i and d_2i+1; the leaves d_n .. d_2n-1 jump to the states
+    for i in range(1, n):
+        children = [f'd{2 * i}', f'd{2 * i + 1}']
+        blocks[f'd{i}'] = [{'label': f'd{i}'}, br(*children)]
+    for i in range(n, 2 * n):
+        blocks[f'd{i}'] = [{'label': f'd{i}'}, jmp(f's{i - n}')]
+    for i in range(n):
+        if i == n - 1:
+            blocks[f's{i}'] = [{'label': f's{i}'}, br('d1', 'exit')]
+        else:
+            blocks[f's{i}'] = [{'label': f's{i}'}, br('d1', f's{rng.randrange(n)}')]
+    blocks['exit'] = [{'label': 'exit'}, {'op': 'ret', 'args': []}]
+    return blocks
+
+
+def nested_loops(n: int, rng: random.Random) -> OrderedDict:
+    '''
+    n loops nested in each other: header i goes to header i + 1 or to the latch of loop i, which goes back to header i.
+    The dominator tree is a path of depth n.
+    '''
+    blocks = OrderedDict()
+    blocks['entry'] = [{'label': 'entry'}, jmp('h0')]
+    for i in range(n):
+        inner = f'h{i + 1}' if i + 1 < n else f'l{i}'
+        blocks[f'h{i}'] = [{'label': f'h{i}'}, br(inner, f'l{i}')]
+    for i in reversed(range(n)):
+        out = f'l{i - 1}' if i > 0 else 'exit'
+        blocks[f'l{i}'] = [{'label': f'l{i}'}, br(f'h{i}', out)]
+    blocks['exit'] = [{'label': 'exit'}, {'op': 'ret', 'args': []}]
+    return blocks
+
+
+SHAPES = {'chain': chain, 'state machine': state_machine, 'nested loops': nested_loops}
+
+
+def best_time(func, cfg: CFG, repeat: int = 3):
+    best = None
+    for _ in range(repeat):
+        cfg._postorder = cfg._rpo = None # both algorithms start from scratch (CHK uses the cached rpo)
+        start = time.perf_counter()
+        result = func(cfg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10, 100, 1000, 10000, 50000]
+
+    print(f"| shape | blocks | {' | '.join(IDOM_ALGORITHMS)} |")
+    print(f"|---|---|{'---|' * len(IDOM_ALGORITHMS)}")
+    for shape, generate in SHAPES.items():
+        for n in sizes:
+            cfg = CFG(generate(n, random.Random(0)))
+            times = list()
+            results = list()
+            for name, algorithm in IDOM_ALGORITHMS.items():
+                elapsed, idom = best_time(algorithm, cfg)
+                times.append(f"{elapsed * 1000:.1f}ms")
+                results.append(idom)
+            if any(idom != results[0] for idom in results):
+                sys.exit(f"{shape}, {n}: the algorithms disagree")
+            print(f"| {shape} | {len(cfg)} | {' | '.join(times)} |")
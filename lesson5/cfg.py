@@ -1,7 +1,10 @@
 from collections import OrderedDict
-from utils import fresh, flatten
+from utils import SymbolTable, flatten
 
-def block_map(blocks: list) -> OrderedDict:
+# Instructions that terminate a basic block.
+TERMINATORS = 'br', 'jmp', 'ret'
+
+def block_map(blocks: list, symbols: SymbolTable = None) -> OrderedDict:
     """Given a sequence of basic blocks, which are lists of instructions,
     produce a `OrderedDict` mapping names to blocks.
 
@@ -12,19 +15,25 @@ def block_map(blocks: list) -> OrderedDict:
 
     Arguments:
         blocks: list
+        symbols: SymbolTable of the function. Fresh block names are taken from it. 
     Return:
         OrderedDict. 
     """
     by_name = OrderedDict()
 
-    label_names = list()
+    if symbols is None:
+        symbols = SymbolTable()
+        symbols.add_instrs(flatten(blocks))
 
     for block in blocks:
         # Generate a name for the block.
         name = block[0].get('label', None)
         if name is None:
-            name = fresh('block.', label_names)
-            label_names.append(name)
+            name = symbols.labels.fresh('block')
+            # directly add the label instr into the blocks
+            label_instr = {"label": name}
+            block.insert(0, label_instr)
+
         # Add the block to the mapping.
         by_name[name] = block
 
@@ -44,7 +53,7 @@ def add_entry(blocks: OrderedDict):
 
     found = False
     for instr in flatten(blocks.values()):
-        if 'labels' in instr and first_label in instr['labels']: # find in-edges to the first block. 
+        if instr.get('op', None) in ('jmp', 'br') and first_label in instr['labels']: # find in-edges to the first block (phi nodes also have labels, but they are not edges). 
             found = True
             break
 
@@ -54,6 +63,146 @@ def add_entry(blocks: OrderedDict):
         blocks[insert_entry_name] = new_block
         blocks.move_to_end(insert_entry_name, last=False) # insert at the beginning
 
+def add_terminators(blocks: OrderedDict):
+    '''
+    Given an ordered block map, modify the blocks to add terminators
+    to all blocks (avoiding "fall-through" control flow transfers).
+    
+    After adding terminators, the last instr in every block is a Terminator instr. 
+    '''
+    names = list(blocks.keys())
+    for i, block in enumerate(blocks.values()):
+        if not block or block[-1].get('op', None) not in TERMINATORS:
+            if i == len(blocks) - 1:
+                # In the last block, return.
+                block.append({'op': 'ret', 'args': []})
+            else:
+                # Otherwise, jump to the next block.
+                block.append({'op': 'jmp', 'labels': [names[i + 1]]})
+
+
+def split_critical_edges(blocks: OrderedDict, symbols: SymbolTable = None) -> list:
+    '''
+    Split every critical edge: an edge from a block with several successors to a block with several predecessors. 
+    A new block, which only jumps to the old target, is put on the edge, so code can be inserted on that edge alone. 
+    The blocks must have terminators (see `add_terminators`). New blocks are appended at the end, and the phi nodes of the 
+    targets are updated. 
+
+    Arguments:
+        blocks: OrderedDict, modified in place. 
+        symbols: SymbolTable of the function. The new block names are taken from it. 
+    Return:
+        list of (new label, pred label, succ label). 
+    '''
+    if symbols is None:
+        symbols = SymbolTable()
+        symbols.add_instrs(flatten(blocks.values()))
+
+    cfg = CFG(blocks)
+    split = list()
+    for name in cfg.names:
+        if len(cfg.succ[name]) < 2:
+            continue
+        terminator = blocks[name][-1]
+        for succ in dict.fromkeys(cfg.succ[name]): # `br cond .a .a` is one edge
+            if len(cfg.pred[succ]) < 2:
+                continue
+            label = symbols.labels.fresh('split')
+            blocks[label] = [{'label': label}, {'op': 'jmp', 'labels': [succ]}]
+            terminator['labels'] = [label if l == succ else l for l in terminator['labels']]
+            for instr in blocks[succ]:
+                if instr.get('op', None) == 'phi':
+                    instr['labels'] = [label if l == name else l for l in instr['labels']]
+            split.append((label, name, succ))
+    return split
+
+
+def block_succ(block: list, next_name: str) -> list:
+    '''
+    Successor labels of one block. `next_name` is the name of the block right after it (None for the last block), 
+    which is where control falls through to if the block has no terminator. 
+    '''
+    last_instr = block[-1] if block else {}
+    op = last_instr.get('op', None)
+    if op == 'jmp':
+        return [last_instr['labels'][0]]
+    elif op == 'br':
+        return list(last_instr['labels']) # all the labels for 'br' instr (actually only 2 labels)
+    elif op == 'ret' or next_name is None:
+        return []
+    else:
+        return [next_name]
+
+
+class CFG:
+    '''
+    Control flow graph of one function, built in a single linear pass over an ordered block map. 
+
+    Attributes:
+        blocks: OrderedDict. Key: name; Value: block (list of instrs). The first block is the entry. 
+        names: list of block names, in program order. 
+        index: dict. Key: name; Value: position of the block in `names`. 
+        succ: dict. Key: label; Value: List of labels (Successors). 
+        pred: dict. Key: label; Value: List of labels (Predecessors), in program order. 
+        entry: label of the entry block. 
+        exits: list of labels of the blocks without successors. 
+    Reverse postorder / postorder (from the entry) are computed on first use and cached. 
+    '''
+    def __init__(self, blocks: OrderedDict):
+        self.blocks = blocks
+        self.names = list(blocks.keys())
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+        self.succ = dict()
+        self.pred = {name: list() for name in self.names}
+        for i, (name, block) in enumerate(blocks.items()):
+            next_name = self.names[i + 1] if i + 1 < len(self.names) else None
+            succ = block_succ(block, next_name)
+            self.succ[name] = succ
+            for s in succ:
+                preds = self.pred.get(s, None)
+                if preds is not None and (not preds or preds[-1] != name): # `br c .a .a` is still one edge
+                    preds.append(name)
+
+        self.entry = self.names[0] if self.names else None
+        self.exits = [name for name in self.names if not self.succ[name]]
+
+        self._postorder = None
+        self._rpo = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def postorder(self) -> list:
+        '''
+        Labels of the blocks reachable from the entry, in postorder of a DFS that visits successors in order. 
+        '''
+        if self._postorder is None:
+            order = list()
+            if self.entry is not None:
+                visited = {self.entry}
+                stack = [(self.entry, iter(self.succ[self.entry]))] # iterative DFS: deep CFGs would hit the recursion limit
+                while stack:
+                    node, succs = stack[-1]
+                    for s in succs:
+                        if s not in visited and s in self.succ:
+                            visited.add(s)
+                            stack.append((s, iter(self.succ[s])))
+                            break
+                    else:
+                        stack.pop()
+                        order.append(node)
+            self._postorder = order
+        return self._postorder
+
+    def rpo(self) -> list:
+        '''
+        Labels of the blocks reachable from the entry, in reverse postorder. 
+        '''
+        if self._rpo is None:
+            self._rpo = list(reversed(self.postorder()))
+        return self._rpo
+
 
 def get_succ(blocks: OrderedDict) -> dict:
     '''
@@ -62,21 +211,7 @@ def get_succ(blocks: OrderedDict) -> dict:
     Arguments: OrderedDict. Key: name; Value: block
     Return: dict. Key: label; Value: List of labels (Successors).
     '''
-    cfg_succ = dict()
-
-    for i, (name, block) in enumerate(blocks.items()):
-        succ = list() 
-        last_instr = block[-1]
-        if last_instr['op'] == 'jmp':
-            succ.append(last_instr['labels'][0])
-        elif last_instr['op'] == 'br':
-            succ.extend(last_instr['labels']) # append all the labels for 'br' instr (actually only 2 labels)
-        elif i < (len(blocks) - 1):
-            succ.append(list(blocks.keys())[i+1])
-
-        cfg_succ[name] = succ
-
-    return cfg_succ
+    return CFG(blocks).succ
 
 def get_pred(blocks: OrderedDict) -> dict:
     '''
@@ -85,24 +220,4 @@ def get_pred(blocks: OrderedDict) -> dict:
     Arguments: OrderedDict. Key: name; Value: block
     Return: dict. Key: label; Value: List of labels (Predecessors).    
     '''
-    def find_predecessor(cfg_succ: dict, curr_label: str) -> list:
-        '''
-        Given CFG (dict) and current label, return the labels of all predecessor blocks. 
-        Return: list of str.  
-        '''
-        pred = list()
-        for label, succ in cfg_succ.items():
-            if curr_label in succ:
-                pred.append(label)
-        return pred
-
-    cfg_pred = dict()
-
-    cfg_succ = get_succ(blocks)
-
-    for i, (name, block) in enumerate(blocks.items()):
-        # curr_label = block_labels[i]
-        pred = find_predecessor(cfg_succ, name)
-        cfg_pred[name] = pred
-
-    return cfg_pred
\ No newline at end of file
+    return CFG(blocks).pred
\ No newline at end of file
@@ -0,0 +1,709 @@
+import sys
+import json
+import copy
+import heapq
+from typing import Tuple, Callable
+from collections import namedtuple
+from utils import form_blocks, Names
+from cfg import CFG, block_map
+
+# A single dataflow analysis consists of these part:
+# - forward: True for forward, False for backward.
+# - init: An initial value (bottom or top of the latice).
+# - merge: Take a list of values and produce a single value.
+# - transfer: The transfer function. function(block, value) -> value.
+# - summary: (optional) function(block) -> (gen, kill), the summary of a block for a gen/kill analysis.
+#   If given, the summary of every block is computed once, and `transfer` is called with the summary
+#   instead of the block, so revisiting a block doesn't walk its instructions again.
+Analysis = namedtuple('Analysis', ['forward', 'init', 'merge', 'transfer', 'summary'], defaults=(None,))
+
+
+def defined_summary(block: list) -> Tuple[set, set]:
+    '''
+    Summary for Reaching Definition: Out(In) = Def(b) U In. Nothing is killed. 
+    '''
+    defined = set()
+    for instr in block:
+        if 'dest' in instr:
+            defined.add(instr['dest'])
+    return defined, set()
+
+def live_summary(block: list) -> Tuple[set, set]:
+    '''
+    Summary for Live Variables: In(Out) = Used(b) U (Out - Def(b)). 
+    A variable is live at some point if it holds a vlue that may be needed in the future, or equivalently if its value may be read before the next time the variable is written to. 
+    Used(b) are the variables read before they are written in the block. 
+    '''
+    # Do it each line from the last instr to the first instr, so that we can handle `a=a+1`. --> a is still a live variable. 
+    used = set()
+    defined = set()
+    for instr in reversed(block): # from the last instr -> first instr
+        if 'dest' in instr:
+            dest = instr['dest']
+            used.discard(dest)
+            defined.add(dest)
+        if 'args' in instr:
+            used.update(instr['args'])
+    return used, defined
+
+def gen_kill_transfer(summary: Tuple[set, set], x: set) -> set:
+    '''
+    Transfer function of a gen/kill analysis, applied to the summary of a block: gen U (x - kill). 
+    '''
+    gen, kill = summary
+    return gen | (x - kill)
+
+def cprop_func(block: list, In: dict) -> dict:
+    '''
+    Forward Transfer function: Constant propagation. 
+    Which variables have statically knowable constant values?
+    In: dict. Key: variable name (dest); Value: value. 
+    '''
+    Out = In.copy()
+
+    for instr in block:
+        if 'dest' in instr:
+            if instr.get('op', None) == 'const': # const op
+                Out[instr['dest']] = instr['value']
+            else: # Arithmetic / Logic / Comparison op
+                Out[instr['dest']] = '?'
+
+    return Out
+
+
+
+def cprop_merge(dicts):
+    '''
+    Merge function for *cprop* (Constant Propagation)
+    For the same var, if value is the same -> keep it; if value is different -> value = ?
+    '''
+    out = dict()
+    for d in dicts:
+        for var, value in d.items():
+            if var in out: # same var
+                if value == out[var]: # value is the same
+                    out[var] = value
+                else:
+                    out[var] = '?' # value is different
+            else: # new var
+                out[var] = value
+
+    return out
+
+
+def union(sets):
+    '''
+    Merge function for *defined* and *live*
+    '''
+    out = set()
+    for s in sets:
+        out.update(s)
+    return out
+
+def print_df(In: dict, Out: dict):
+    '''
+    Print the result of Dataflow Analysis based on certain format. 
+    in_var, out_var could be *set* or *dict*
+    '''
+
+
+    for block_label in In.keys():
+        in_var = In[block_label]
+        out_var = Out[block_label]
+
+        if isinstance(in_var, set):
+            in_var = ', '.join(sorted(in_var)) if (len(in_var) != 0) else '∅'
+            out_var = ', '.join(sorted(out_var)) if (len(out_var) != 0) else '∅'
+        elif isinstance(in_var, dict):
+            if (len(in_var) != 0):
+                in_var = ', '.join('{}: {}'.format(k, v)
+                                            for k,v in sorted(in_var.items()))
+            else:
+                in_var = '∅'
+            
+            if (len(out_var) != 0):
+                out_var = ', '.join('{}: {}'.format(k, v)
+                                        for k,v in sorted(out_var.items()))
+            else:
+                out_var = '∅'
+
+        print(f"{block_label}:")
+        # print(f"  in:  {', '.join(sorted(in_var))}")
+        # print(f"  out: {', '.join(sorted(Out[block_label]))}")
+        print(f"  in:  {in_var}")
+        print(f"  out: {out_var}")
+
+
+def forward_worklist(worklist, cfg: CFG, In: dict, Out: dict, transfer: Callable, merge: Callable, counts: dict = None) -> Tuple[dict, dict]:
+    '''
+    Worklist algorithms with forward propagation. 
+    Args: worklist (a Worklist, or a plain set), cfg, In, Out, transfer, merge, counts
+        counts: if given, counts[label] is incremented every time the transfer function of the block is evaluated. 
+    Return: (In, Out)
+    '''
+    while len(worklist) > 0: # not empty
+        curr_label = worklist.pop() # pick a block from worklist
+
+        if DEBUG:
+            print(f"Curr label: {curr_label}")
+        
+        In[curr_label] = merge(Out[pred_label] for pred_label in cfg.pred[curr_label]) # merge function
+            
+        curr_block = cfg.blocks[curr_label]
+        
+        Out_old = Out[curr_label] # set. old Out[b]
+
+        if DEBUG:
+            print(f"Before: In: {In[curr_label]}, Out: {Out[curr_label]}")
+        Out[curr_label] = transfer(curr_block, In[curr_label]) # transfer function
+        if counts is not None:
+            counts[curr_label] = counts.get(curr_label, 0) + 1
+
+        if Out[curr_label] != Out_old: # out[b] changed
+            worklist.update(cfg.succ[curr_label]) # add sucessors of b
+        
+        if DEBUG:
+            print(f"After: In: {In[curr_label]}, Out: {Out[curr_label]}")
+            print(f"Worklist: {worklist}")
+            print("\n")
+    
+    return In, Out
+
+
+def backward_worklist(worklist, cfg: CFG, In: dict, Out: dict, transfer: Callable, merge: Callable, counts: dict = None) -> Tuple[dict, dict]:
+    '''
+    Worklist algorithms with backward propagation. 
+    Args: worklist (a Worklist, or a plain set), cfg, In, Out, transfer, merge, counts
+        counts: if given, counts[label] is incremented every time the transfer function of the block is evaluated. 
+    Return: (In, Out)
+    '''
+    while len(worklist) > 0: # not empty
+        curr_label = worklist.pop() # pick a block from worklist
+
+        if DEBUG:
+            print(f"Curr label: {curr_label}")
+
+        Out[curr_label] = merge(In[succ_label] for succ_label in cfg.succ[curr_label]) # merge function
+
+        curr_block = cfg.blocks[curr_label]
+        
+        In_old = In[curr_label] # set. old In[b]
+
+        if DEBUG:
+            print(f"Before: In: {In[curr_label]}, Out: {Out[curr_label]}")
+        In[curr_label] = transfer(curr_block, Out[curr_label]) # transfer function
+        if counts is not None:
+            counts[curr_label] = counts.get(curr_label, 0) + 1
+
+        if In[curr_label] != In_old: # in[b] changed
+            worklist.update(cfg.pred[curr_label]) # add predecessors of b
+        
+        if DEBUG:
+            print(f"After: In: {In[curr_label]}, Out: {Out[curr_label]}")
+            print(f"Worklist: {worklist}")
+            print("\n")
+    
+    return In, Out    
+
+
+
+def block_order(cfg: CFG, forward: bool) -> list:
+    '''
+    The order in which blocks should be visited: reverse postorder for forward problems (a block comes after its predecessors, 
+    except along back edges), postorder for backward problems. Blocks not reachable from the entry come last, in program order. 
+    '''
+    order = cfg.rpo() if forward else cfg.postorder()
+    reachable = set(order)
+    return order + [label for label in cfg.names if label not in reachable]
+
+
+class Worklist:
+    '''
+    Priority worklist of block labels, in passes over `order`: `pop` returns the queued label that comes first in `order` after the 
+    last popped one. A label queued behind the current position (e.g. a loop header, along a back edge) waits for the next pass, 
+    so a pass never goes back: each one is a sweep in `order` over the changed blocks only. A label is never queued twice. 
+    Same interface as the `set` the worklist algorithms used to take (`pop`, `update`, `len`). 
+    labels: if given, only these labels are queued at the start (all of `order` by default). 
+    '''
+    def __init__(self, order: list, labels=None):
+        self.order = order
+        self.priority = {label: i for i, label in enumerate(order)}
+        if labels is None: # every block is queued at the start
+            self.current = list(range(len(order))) # heap of priorities of this pass
+            self.queued = set(order)
+        else:
+            self.current = sorted(self.priority[label] for label in labels)
+            self.queued = set(labels)
+        self.next = list() # heap of priorities of the next pass
+        self.position = -1 # priority of the last popped label
+
+    def pop(self):
+        if not self.current: # start the next pass
+            self.current, self.next = self.next, self.current
+        self.position = heapq.heappop(self.current)
+        label = self.order[self.position]
+        self.queued.discard(label)
+        return label
+
+    def update(self, labels):
+        for label in labels:
+            if label not in self.queued:
+                self.queued.add(label)
+                priority = self.priority[label]
+                heapq.heappush(self.current if priority > self.position else self.next, priority)
+
+    def __len__(self):
+        return len(self.current) + len(self.next)
+
+    def __repr__(self):
+        return f"Worklist({[self.order[i] for i in sorted(self.current) + sorted(self.next)]})"
+
+
+def round_robin(order: list, cfg: CFG, In: dict, Out: dict, transfer: Callable, merge: Callable, forward: bool, counts: dict = None) -> Tuple[dict, dict]:
+    '''
+    Round-robin iteration, for comparison with the worklist: visit every block in `order` until a whole pass changes nothing. 
+    Return: (In, Out)
+    '''
+    changed = True
+    while changed:
+        changed = False
+        for label in order:
+            block = cfg.blocks[label]
+            if forward:
+                In[label] = merge(Out[pred_label] for pred_label in cfg.pred[label])
+                new = transfer(block, In[label])
+                if new != Out[label]:
+                    Out[label] = new
+                    changed = True
+            else:
+                Out[label] = merge(In[succ_label] for succ_label in cfg.succ[label])
+                new = transfer(block, Out[label])
+                if new != In[label]:
+                    In[label] = new
+                    changed = True
+            if counts is not None:
+                counts[label] = counts.get(label, 0) + 1
+    return In, Out
+
+
+# How blocks are picked: 'worklist' (priority worklist in rpo / postorder), 'round-robin', or 'set' (a plain set, arbitrary order). 
+ORDERS = ('worklist', 'round-robin', 'set')
+
+
+def iterate(cfg: CFG, forward: bool, In: dict, Out: dict, transfer: Callable, merge: Callable, order: str = 'worklist', counts: dict = None) -> Tuple[dict, dict]:
+    '''
+    Solve the dataflow equations from the initial In / Out, with the iteration strategy `order` (see ORDERS). 
+    '''
+    if order == 'round-robin':
+        return round_robin(block_order(cfg, forward), cfg, In, Out, transfer, merge, forward, counts)
+    if order == 'set':
+        worklist = set(cfg.names)
+    elif order == 'worklist':
+        worklist = Worklist(block_order(cfg, forward))
+    else:
+        raise ValueError(f"Unknown order: {order}. Available orders: {', '.join(ORDERS)}")
+    worklist_algo = forward_worklist if forward else backward_worklist
+    return worklist_algo(worklist, cfg, In, Out, transfer, merge, counts)
+
+
+def solve_df(cfg: CFG, analysis: Analysis, order: str = 'worklist', counts: dict = None) -> Tuple[dict, dict]:
+    '''
+    Run dataflow analysis given the CFG of a function and the analysis method. 
+
+    Data sturctures;
+        In: dict. Key: Label; Value: variables (set)
+        Out: dict. Key: Label; Value: variables (set)
+        cfg: CFG. Blocks, successors and predecessors of each label. 
+        order: how blocks are picked (see ORDERS). By default, a priority worklist in reverse postorder (forward) or postorder (backward). 
+        counts: if given, Key: Label; Value: number of times its transfer function was evaluated. 
+    Return: (In, Out)
+    '''
+
+    # gen/kill analyses: summarize every block once
+    if analysis.summary is not None:
+        cfg = summarize(cfg, analysis.summary)
+
+    # initialization
+    In = dict()
+    Out = dict()
+
+    for label in cfg.names:
+        In[label] = analysis.init
+        Out[label] = analysis.init
+    
+    # worklist algorithm
+    return iterate(cfg, analysis.forward, In, Out, analysis.transfer, analysis.merge, order, counts)
+
+
+class IncrementalDF:
+    '''
+    A dataflow solution that is kept up to date after local edits, instead of solving the whole function again. 
+
+    After the instructions of some blocks changed, `update(changed)` summarizes those blocks again, resets In / Out of every block 
+    they can affect (the blocks reachable from them: along the edges for a forward problem, against them for a backward one) to 
+    `init`, and runs the worklist on these blocks only. The other blocks don't depend on the edit, so they keep their values. 
+    Restarting the affected blocks from `init` is what makes the result identical to a solve from scratch: continuing from the old 
+    values could get stuck at a fixed point above the new one (e.g. a variable kept alive around a loop by a use that was deleted). 
+
+    The edges of the CFG must not change: after adding / removing blocks or changing a terminator, build a new IncrementalDF. 
+
+    Data structures:
+        cfg: the CFG whose blocks are edited in place. 
+        In / Out: dict. Key: Label; Value: the current solution. 
+        check: if True, every update is compared with a solve from scratch, and an AssertionError names the blocks that differ. 
+    '''
+    def __init__(self, cfg: CFG, analysis: Analysis, order: str = 'worklist', check: bool = False, counts: dict = None):
+        self.cfg = cfg
+        self.analysis = analysis
+        self.order = order
+        self.check = check
+        # the CFG the solver runs on: the same as `cfg`, or its summary (own `blocks` dict, shared succ / pred)
+        self.solve_cfg = summarize(cfg, analysis.summary) if analysis.summary is not None else cfg
+        self.In = {label: analysis.init for label in cfg.names}
+        self.Out = {label: analysis.init for label in cfg.names}
+        iterate(self.solve_cfg, analysis.forward, self.In, self.Out, analysis.transfer, analysis.merge, order, counts)
+
+    def affected(self, changed) -> set:
+        '''
+        The blocks whose In / Out may depend on the blocks in `changed` (including them). 
+        '''
+        edges = self.cfg.succ if self.analysis.forward else self.cfg.pred
+        seen = set(changed)
+        stack = list(changed)
+        while stack:
+            for label in edges[stack.pop()]:
+                if label not in seen:
+                    seen.add(label)
+                    stack.append(label)
+        return seen
+
+    def update(self, changed, counts: dict = None) -> Tuple[dict, dict]:
+        '''
+        Re-solve after the instructions of the blocks in `changed` (labels) were edited. 
+        Return: (In, Out)
+        '''
+        unknown = set(changed) - set(self.cfg.blocks)
+        if unknown:
+            raise ValueError(f"Unknown blocks: {', '.join(sorted(unknown))}. The CFG must not change: build a new IncrementalDF")
+        analysis = self.analysis
+        if analysis.summary is not None:
+            for label in changed:
+                self.solve_cfg.blocks[label] = analysis.summary(self.cfg.blocks[label])
+
+        affected = self.affected(changed)
+        for label in affected:
+            self.In[label] = analysis.init
+            self.Out[label] = analysis.init
+
+        order = block_order(self.cfg, analysis.forward)
+        if self.order == 'round-robin':
+            round_robin([label for label in order if label in affected], self.solve_cfg, self.In, self.Out,
+                        analysis.transfer, analysis.merge, analysis.forward, counts)
+        else:
+            if self.order == 'set':
+                worklist = set(affected)
+            elif self.order == 'worklist':
+                worklist = Worklist(order, affected)
+            else:
+                raise ValueError(f"Unknown order: {self.order}. Available orders: {', '.join(ORDERS)}")
+            worklist_algo = forward_worklist if analysis.forward else backward_worklist
+            worklist_algo(worklist, self.solve_cfg, self.In, self.Out, analysis.transfer, analysis.merge, counts)
+
+        if self.check:
+            In, Out = solve_df(self.cfg, analysis, self.order)
+            wrong = [label for label in self.cfg.names if In[label] != self.In[label] or Out[label] != self.Out[label]]
+            assert not wrong, f"Incremental solve differs from a full solve in blocks: {', '.join(wrong)}"
+        return self.In, self.Out
+
+
+# Bit-vector backend for the gen/kill analyses (defined, live).
+# Every variable gets a bit position (its id in a `Names` table), and a set of variables is a Python int.
+# Python ints have arbitrary width, so merge (OR) and transfer (AND-NOT, OR) are single C-level loops over
+# machine words even for functions with thousands of variables.
+
+def var_bits(vars, names: Names) -> int:
+    '''
+    The bit vector of a collection of variables. 
+    '''
+    bits = 0
+    for var in vars:
+        bits |= 1 << names.intern(var)
+    return bits
+
+
+def bits_to_set(bits: int, names: Names) -> set:
+    '''
+    The set of variable names of a bit vector. 
+    '''
+    out = set()
+    while bits:
+        low = bits & -bits # lowest set bit
+        out.add(names[low.bit_length() - 1])
+        bits ^= low
+    return out
+
+
+def bits_union(values) -> int:
+    '''
+    Merge function on bit vectors: union is bitwise OR. 
+    '''
+    out = 0
+    for v in values:
+        out |= v
+    return out
+
+
+def bits_transfer(summary: Tuple[int, int], x: int) -> int:
+    gen, kill = summary
+    return gen | (x & ~kill)
+
+
+def summarize(cfg: CFG, summary: Callable) -> CFG:
+    '''
+    A copy of the CFG whose blocks are replaced by their summaries. It shares succ / pred with `cfg`, 
+    so the worklist algorithms run on it unchanged. 
+    '''
+    summary_cfg = copy.copy(cfg)
+    summary_cfg.blocks = {label: summary(block) for label, block in cfg.blocks.items()}
+    return summary_cfg
+
+
+def solve_bits(cfg: CFG, analysis: Analysis, names: Names = None, order: str = 'worklist', counts: dict = None) -> Tuple[dict, dict, Names]:
+    '''
+    Run a gen/kill analysis (it must have a `summary`) on bit vectors, with the same worklist algorithms as `solve_df`. 
+
+    Return: (In, Out, names). In / Out values are bit vectors (int); `names` maps bit positions back to variables. 
+    '''
+    if names is None:
+        names = Names()
+    def bits_summary(block):
+        gen, kill = analysis.summary(block)
+        return var_bits(gen, names), var_bits(kill, names)
+
+    In = {label: 0 for label in cfg.names}
+    Out = {label: 0 for label in cfg.names}
+    In, Out = iterate(summarize(cfg, bits_summary), analysis.forward, In, Out, bits_transfer, bits_union, order, counts)
+    return In, Out, names
+
+
+# Reaching definitions over definition sites.
+# A definition site is (block label, index of the instr in `cfg.blocks[label]`), so `cfg.blocks[label][index]` is the instr;
+# the i-th function argument is defined at (None, i). Every site gets a bit, and the analysis runs on the bit-vector backend.
+
+class ReachingDefs:
+    '''
+    Result of `reaching_defs`. 
+
+    Data structures:
+        sites: list of definition sites. The position of a site in the list is its id (its bit). 
+        site_var: list. The variable defined at each site. 
+        In / Out: dict. Key: Label; Value: bit vector of the sites reaching the start / end of the block. 
+        use_def: dict. Key: use site (label, index); Value: dict(variable -> list of the def sites reaching that use). 
+        def_use: dict. Key: def site; Value: list of the use sites it reaches. 
+    '''
+    def __init__(self):
+        self.sites = list()
+        self.site_ids = dict()
+        self.site_var = list()
+        self.In = dict()
+        self.Out = dict()
+        self.use_def = dict()
+        self.def_use = dict()
+
+    def add_site(self, site: tuple, var: str) -> int:
+        id = len(self.sites)
+        self.sites.append(site)
+        self.site_ids[site] = id
+        self.site_var.append(var)
+        self.def_use[site] = list()
+        return id
+
+    def defs(self, use: tuple, var: str) -> list:
+        '''
+        Use-def chain: the definition sites of `var` that reach the instr at site `use`. 
+        '''
+        return self.use_def.get(use, {}).get(var, [])
+
+    def uses(self, site: tuple) -> list:
+        '''
+        Def-use chain: the instrs (sites) that may read the value defined at `site`. 
+        '''
+        return self.def_use.get(site, [])
+
+    def reaching(self, bits: int) -> list:
+        '''
+        The definition sites of a bit vector. 
+        '''
+        out = list()
+        while bits:
+            low = bits & -bits
+            out.append(self.sites[low.bit_length() - 1])
+            bits ^= low
+        return out
+
+
+def reaching_defs(cfg: CFG, func_args: list = (), order: str = 'worklist') -> ReachingDefs:
+    '''
+    Reaching definitions of a function, with its use-def and def-use chains. 
+    Phi nodes are treated like any other instr: their args are uses at the phi. 
+
+    Arguments:
+        cfg: CFG of the function. 
+        func_args: the `args` of the function (list of dicts with a `name`). 
+    Return: ReachingDefs
+    '''
+    rd = ReachingDefs()
+    var_sites = dict() # Key: variable; Value: bit vector of all its definition sites
+
+    for i, func_arg in enumerate(func_args):
+        id = rd.add_site((None, i), func_arg['name'])
+        var_sites[func_arg['name']] = var_sites.get(func_arg['name'], 0) | (1 << id)
+    args_bits = (1 << len(rd.sites)) - 1
+    for label, block in cfg.blocks.items():
+        for index, instr in enumerate(block):
+            if 'dest' in instr:
+                id = rd.add_site((label, index), instr['dest'])
+                var_sites[instr['dest']] = var_sites.get(instr['dest'], 0) | (1 << id)
+
+    # gen: the last definition of each variable in the block; kill: every definition of the variables it defines. 
+    def summary(block):
+        label = block[0]['label'] # every block in the CFG starts with its label
+        last = dict()
+        for index, instr in enumerate(block):
+            if 'dest' in instr:
+                last[instr['dest']] = rd.site_ids[(label, index)]
+        gen = 0
+        kill = 0
+        for var, id in last.items():
+            gen |= 1 << id
+            kill |= var_sites[var]
+        if label == cfg.entry: # the function args are defined right before the entry block
+            gen |= args_bits & ~kill
+        return gen, kill
+
+    In = {label: 0 for label in cfg.names}
+    Out = {label: 0 for label in cfg.names}
+    rd.In, rd.Out = iterate(summarize(cfg, summary), True, In, Out, bits_transfer, bits_union, order)
+    if cfg.entry is not None:
+        rd.In[cfg.entry] |= args_bits
+
+    # chains: walk every block from the definitions reaching its start
+    for label, block in cfg.blocks.items():
+        current = dict() # Key: variable; Value: list of its def sites reaching this point
+        for site in rd.reaching(rd.In[label]):
+            current.setdefault(rd.site_var[rd.site_ids[site]], list()).append(site)
+        for index, instr in enumerate(block):
+            use = (label, index)
+            for arg in instr.get('args', []):
+                defs = current.get(arg, [])
+                rd.use_def.setdefault(use, dict())[arg] = defs
+                for site in defs:
+                    if use not in rd.def_use[site]: # `add a a` is one use
+                        rd.def_use[site].append(use)
+            if 'dest' in instr:
+                current[instr['dest']] = [use]
+    return rd
+
+
+def format_site(site: tuple, var: str) -> str:
+    label, index = site
+    if label is None:
+        return f"{var}@args"
+    return f"{var}@{label}:{index}"
+
+
+def print_reaching(rd: ReachingDefs, cfg: CFG):
+    '''
+    Print the reaching definitions of every block (with `print_df`), then the use-def chain of every use. 
+    '''
+    def site_set(bits):
+        return {format_site(site, rd.site_var[rd.site_ids[site]]) for site in rd.reaching(bits)}
+    print_df({label: site_set(rd.In[label]) for label in cfg.names}, {label: site_set(rd.Out[label]) for label in cfg.names})
+
+    print("use-def:")
+    for (label, index), chains in rd.use_def.items():
+        for var, defs in chains.items():
+            sites = ', '.join(sorted(format_site(site, var) for site in defs)) if defs else '∅'
+            print(f"  {label}:{index} {var}: {sites}")
+
+
+def run_df(func, analysis, bits=False, order='worklist', stats=False):
+    '''
+    Run dataflow analysis on a function and print the result. 
+    With `bits`, a gen/kill analysis is solved on bit vectors; the result is printed the same way. 
+    With `stats`, the number of transfer function evaluations is printed to stderr. 
+    '''
+    cfg = CFG(block_map(list(form_blocks(func['instrs']))))
+    counts = dict()
+
+    if bits:
+        In, Out, names = solve_bits(cfg, analysis, order=order, counts=counts)
+        In = {label: bits_to_set(v, names) for label, v in In.items()}
+        Out = {label: bits_to_set(v, names) for label, v in Out.items()}
+    else:
+        In, Out = solve_df(cfg, analysis, order=order, counts=counts)
+
+    print_df(In, Out)
+    if stats:
+        print(f"{func['name']}: {sum(counts.values())} transfer evaluations for {len(cfg)} blocks", file=sys.stderr)
+            
+
+def run_incremental(func, analysis, order='worklist', stats=False):
+    '''
+    Test mode of IncrementalDF: delete the first instruction with a dest of every block, one block at a time, update the 
+    solution incrementally after each edit (checked against a solve from scratch), and print the final result. 
+    With `stats`, the transfer evaluations of the updates and of the full solves they replace are printed to stderr. 
+    '''
+    cfg = CFG(block_map(list(form_blocks(func['instrs']))))
+    inc = IncrementalDF(cfg, analysis, order, check=True)
+    inc_counts = dict()
+    full_counts = dict()
+
+    for label, block in cfg.blocks.items():
+        for i, instr in enumerate(block):
+            if 'dest' in instr:
+                del block[i]
+                inc.update([label], inc_counts)
+                if stats:
+                    solve_df(cfg, analysis, order, full_counts)
+                break
+
+    print_df(inc.In, inc.Out)
+    if stats:
+        print(f"{func['name']}: {sum(inc_counts.values())} transfer evaluations incrementally, {sum(full_counts.values())} with full solves", file=sys.stderr)
+
+
+DEBUG = False
+
+
+ANALYSIS = {
+    'defined': Analysis(True, init=set(), merge=union, transfer=gen_kill_transfer, summary=defined_summary),
+    'live': Analysis(False, init=set(), merge=union, transfer=gen_kill_transfer, summary=live_summary),
+    'cprop': Analysis(True, init=dict(), merge=cprop_merge, transfer=cprop_func)
+}
+
+if __name__ == "__main__":
+    bits = '-b' in sys.argv # use the bit-vector backend (gen/kill analyses only)
+    stats = '-s' in sys.argv # print the number of transfer function evaluations
+    incremental = '-i' in sys.argv # test mode of the incremental solver (see run_incremental)
+    order = 'worklist'
+    if '-r' in sys.argv: # round-robin instead of the priority worklist
+        order = 'round-robin'
+    if '-u' in sys.argv: # unordered: a plain set worklist
+        order = 'set'
+    if (len(sys.argv) > 1) and sys.argv[1] != 'reaching': # reaching definitions over def sites, with use-def chains
+        analysis = ANALYSIS[sys.argv[1]]
+        if bits and analysis.summary is None:
+            sys.exit(f"{sys.argv[1]} is not a gen/kill analysis: it has no bit-vector version")
+        if bits and incremental:
+            sys.exit("-i runs on sets: it can't be combined with -b")
+
+    prog = json.load(sys.stdin)
+    for func in prog['functions']:
+        if sys.argv[1] == 'reaching':
+            cfg = CFG(block_map(list(form_blocks(func['instrs']))))
+            print_reaching(reaching_defs(cfg, func.get('args', []), order), cfg)
+        elif incremental:
+            run_incremental(func, analysis, order, stats)
+        else:
+            run_df(func, analysis, bits, order, stats)
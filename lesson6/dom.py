@@ -1,4 +1,6 @@
-import copy
+from collections.abc import Mapping
+
+from cfg import CFG
 
 def intersect(sets: list) -> set:
     '''
@@ -20,102 +22,292 @@ def intersect(sets: list) -> set:
 
     return out
 
-def get_dom_frontier(dom: dict, cfg_succ: dict) -> dict:
+def get_dom_frontier(dom: dict, cfg: CFG) -> dict:
     '''
     A's domination frontier contains B if A does not *strictly dominate* B, but A *dominates* a predecessor of B. 
     (Note that here: one is *strict dominate*, anotehr is *dominate*)
 
-    Equal to: A's domination frontier contains C, if A *dominates* B, and A does not *strictly dominate* C (the successor of B)
+    Computed with the "runner" of Cytron et al. / Cooper, Harvey & Kennedy: for each block B and each of its predecessors P, 
+    walk up the dominator tree from P until the idom of B. Every block on the way dominates P but doesn't strictly dominate B, 
+    so B is in its frontier. The time is proportional to the size of the frontiers, and each B is added at most once per block: 
+    a walk stops at a block that already has B (the blocks above it are done too). 
 
     Arguments:
-        dom: dict. Key: block label; Value: *set* of block labels.
-        cfg_succ: dict. Key: block label; Value: *list* of block labels. 
+        dom: DomSets, or dict. Key: block label; Value: *set* of block labels.
+        cfg: CFG of the function. 
     Return:
-        df: dict. Key: block label; Value: *list* of block labels. 
-    '''
-    # generate a strict_dom dict
-    strict_dom = copy.deepcopy(dom)
-    for block_label, dom_labels in strict_dom.items():
-        strict_dom[block_label].remove(block_label)
-
-    df = dict()
-    # initialization: empty list
-    for block_label in dom.keys():
-        df[block_label] = list()
-    
-    for block_label, dom_labels in dom.items(): # block_label: B
-        succ_list = cfg_succ[block_label]
-        for dom_label in dom_labels: # dom_label: A
-            for succ in succ_list:
-                # print(f"A: {dom_label}, B: {block_label}, C: {succ}")
-                if dom_label not in strict_dom[succ]: # dom[succ] is the strict dominators of succ (C). If A is not the strict dominator of C
-                    df[dom_label].append(succ)
-                    # print(f"YES! A: {dom_label}, C: {succ}")
+        df: dict. Key: block label; Value: *list* of block labels, without duplicates. 
+    '''
+    idom = get_idom(dom)
+    df = {block_label: list() for block_label in idom}
+
+    for block_label in idom: # B
+        for pred in cfg.pred[block_label]: # P
+            if idom.get(pred) is None and pred != cfg.entry: # P is not reachable
+                continue
+            runner = pred
+            while runner is not None and runner != idom[block_label]:
+                if df[runner] and df[runner][-1] == block_label: # reached from another predecessor of B already
+                    break
+                df[runner].append(block_label)
+                runner = idom[runner]
 
     return df
 
-def get_dom_tree(dom: dict) -> dict:
+def get_idom(dom: dict) -> dict:
+    '''
+    The immediate dominator of each block: `dom.idom` for a DomSets (see find_dom). For a plain dict of dominator sets, 
+    the idom of B is its strict dominator with the most dominators (one less than B). 
+
+    Arguments:
+        dom: DomSets, or dict. Key: block label; Value: *set* of block labels.
+    Return:
+        idom: dict. Key: block label; Value: label of its immediate dominator, None if it has none. 
+    '''
+    idom = getattr(dom, 'idom', None)
+    if idom is None:
+        idom = dict()
+        for block_label, dom_labels in dom.items():
+            strict = [d for d in dom_labels if d != block_label]
+            idom[block_label] = max(strict, key=lambda d: len(dom[d])) if strict else None
+    return idom
+
+
+class DomTree(dict):
+    '''
+    The dominator tree: a dict. Key: block label; Value: *list* of block labels, the children of the block (in program order). 
+
+    Data structures:
+        parent: dict. Key: block label; Value: its immediate dominator (None for a root). 
+        depth: dict. Key: block label; Value: number of strict dominators (0 for a root). 
+        roots: list of the blocks without idom: the entry, then the blocks that are not reachable from it. 
+    '''
+    def __init__(self, idom: dict):
+        super().__init__((label, list()) for label in idom)
+        self.parent = dict(idom)
+        self.roots = list()
+        for label, parent in idom.items():
+            if parent is None:
+                self.roots.append(label)
+            else:
+                self[parent].append(label)
+
+        self.depth = dict()
+        for label in self.preorder(): # a parent comes before its children
+            parent = self.parent[label]
+            self.depth[label] = 0 if parent is None else self.depth[parent] + 1
+
+    def preorder(self):
+        '''
+        Iterate over the blocks in preorder: a block comes before its children, and the children in order. 
+        '''
+        stack = list(reversed(self.roots))
+        while stack:
+            label = stack.pop()
+            yield label
+            stack.extend(reversed(self[label]))
+
+    def postorder(self):
+        '''
+        Iterate over the blocks in postorder: a block comes after all its children. 
+        '''
+        stack = [(label, False) for label in reversed(self.roots)]
+        while stack:
+            label, done = stack.pop()
+            if done:
+                yield label
+            else:
+                stack.append((label, True))
+                stack.extend((child, False) for child in reversed(self[label]))
+
+
+def get_dom_tree(dom: dict) -> DomTree:
     '''
-    Get the Dominator Tree given the dom dict, return a dict called `dom_tree`.
+    Get the Dominator Tree given the dom dict, return a DomTree called `dom_tree`.
 
     A immediately dominates B iff A strictly dominates B, but A does not strictly dominate any other node that strictly dominates B. 
+    So the tree is just the idom of each block (see get_idom): O(n) from `dom.idom`. 
 
     Arguments:
-        dom: dict. Key: block label; Value: *set* of block labels.
-        cfg_pred: dict. Key: block label; Value: *list* of block labels. 
+        dom: DomSets, or dict. Key: block label; Value: *set* of block labels.
     Return:
-        dom_tree: dict. Key: block label; Value: *list* of block labels. Each element in the list is a child node of the Key node. 
+        dom_tree: DomTree. Key: block label; Value: *list* of block labels. Each element in the list is a child node of the Key node. 
+    '''
+    return DomTree(get_idom(dom))
+
+def find_idom(cfg: CFG) -> dict:
     '''
-    dom_tree = dict()
-    # initialization: empty list
-    for block_label in dom.keys():
-        dom_tree[block_label] = list()
+    Immediate dominators, with the "simple, fast" algorithm of Cooper, Harvey & Kennedy. 
+    Blocks are numbered in reverse postorder, and idom is an array over these numbers: the dominators of a block are its idom, 
+    the idom of its idom, ... up to the entry. The idom of a block is the intersection of the dominators of its (already processed) 
+    predecessors, found with two fingers walking up the idom array: the finger with the larger number moves up until they meet. 
 
-    # generate a strict_dom dict
-    strict_dom = copy.deepcopy(dom)
-    for block_label, dom_labels in strict_dom.items():
-        strict_dom[block_label].remove(block_label)
+    Arguments: 
+        cfg: CFG of the function. 
+    Return: 
+        idom: dict. Key: block label; Value: label of its immediate dominator. None for the entry and for the blocks that are not reachable from it. 
+    '''
+    order = cfg.rpo()
+    number = {label: i for i, label in enumerate(order)}
+    preds = [[number[p] for p in cfg.pred[label] if p in number] for label in order]
+    doms = [None] * len(order) # doms[i]: number of the idom of block i (None: not known yet)
+    if order:
+        doms[0] = 0 # the entry
+
+    def two_fingers(a: int, b: int) -> int:
+        while a != b:
+            while a > b:
+                a = doms[a]
+            while b > a:
+                b = doms[b]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for i in range(1, len(order)):
+            new_idom = None
+            for p in preds[i]:
+                if doms[p] is None: # not processed yet
+                    continue
+                new_idom = p if new_idom is None else two_fingers(p, new_idom)
+            if doms[i] != new_idom:
+                doms[i] = new_idom
+                changed = True
 
-    for block_label, dom_labels in strict_dom.items(): # B: block_label
-        for dom_label in dom_labels: # A: dom_label
-            result = True
-            for strict_dom_label in strict_dom[block_label]: # node that strictly dominates B
-                if dom_label in strict_dom[strict_dom_label]: # A dominate one node that strictly dominates B, then A does not imm dominates B. 
-                    result = False
-            if result:
-                dom_tree[dom_label].append(block_label)
+    idom = {label: None for label in cfg.pred}
+    for i in range(1, len(order)):
+        idom[order[i]] = order[doms[i]]
+    return idom
 
-    return dom_tree
 
-def find_dom(cfg_pred: dict) -> dict:
+def find_idom_lt(cfg: CFG) -> dict:
     '''
-    Algorithm for Finding Dominators. 
-    A dominates B iff all paths from the entry to B include A. --> A is the dominator of B. 
+    Immediate dominators, with the semi-NCA variant of the Lengauer-Tarjan algorithm (near-linear time, for very large CFGs). 
+    1. Number the blocks in DFS preorder, and keep the parent of each block in the DFS tree. 
+    2. In reverse preorder, compute the semidominator of each block: the smallest number from which there is a path to the block 
+       through blocks with larger numbers only. It's found with `eval` on a forest of the blocks already processed 
+       (linked to their DFS parent), with path compression. 
+    3. In preorder, the idom of a block is the nearest common ancestor of its DFS parent and its semidominator in the dominator 
+       tree built so far: walk up the idoms from the parent until the number is not larger than the semidominator. 
 
     Arguments: 
-        cfg_pred: dict. Key: block label; Value: *list* of block labels. 
+        cfg: CFG of the function. 
     Return: 
-        dom: dict. Key: block label; Value: *set* of block labels.
-    Note that block labels are all unique. 
+        idom: dict. Same as find_idom. 
     '''
-    dom = dict()
-    # initialization: {every block -> all blocks}
-    all_blocks = set(cfg_pred.keys())
-    for block_label in cfg_pred.keys():
-        dom[block_label] = all_blocks    
-    while True:
-        changed = False
-        for block_label in cfg_pred.keys():
+    vertex = list() # preorder number -> label
+    number = dict() # label -> preorder number
+    parent = list() # preorder number -> preorder number of the DFS parent
+    if cfg.entry is not None:
+        number[cfg.entry] = 0
+        vertex.append(cfg.entry)
+        parent.append(None)
+        stack = [(cfg.entry, iter(cfg.succ[cfg.entry]))] # iterative DFS: deep CFGs would hit the recursion limit
+        while stack:
+            node, succs = stack[-1]
+            for s in succs:
+                if s not in number and s in cfg.succ:
+                    number[s] = len(vertex)
+                    vertex.append(s)
+                    parent.append(number[node])
+                    stack.append((s, iter(cfg.succ[s])))
+                    break
+            else:
+                stack.pop()
 
-            new_dom = {block_label} | (intersect([dom[p] for p in cfg_pred[block_label]]))
+    n = len(vertex)
+    semi = list(range(n))
+    ancestor = [None] * n # link forest of the processed blocks
+    best = list(range(n)) # best[v]: block with the smallest semi on the compressed path from v to the root of its tree
 
-            if dom[block_label] != new_dom:
-                changed = True
-                dom[block_label] = new_dom
+    def eval(v: int) -> int:
+        if ancestor[v] is None:
+            return v
+        # path compression, from the top of the path down (iterative version of the recursive `compress`)
+        path = list()
+        u = v
+        while ancestor[ancestor[u]] is not None:
+            path.append(u)
+            u = ancestor[u]
+        for u in reversed(path):
+            a = ancestor[u]
+            if semi[best[a]] < semi[best[u]]:
+                best[u] = best[a]
+            ancestor[u] = ancestor[a]
+        return best[v]
+
+    for w in range(n - 1, 0, -1):
+        for p in cfg.pred[vertex[w]]:
+            if p in number: # predecessors that are not reachable don't count
+                u = eval(number[p])
+                if semi[u] < semi[w]:
+                    semi[w] = semi[u]
+        ancestor[w] = parent[w]
+
+    doms = [0] * n
+    for w in range(1, n):
+        d = parent[w]
+        while d > semi[w]:
+            d = doms[d]
+        doms[w] = d
+
+    idom = {label: None for label in cfg.pred}
+    for w in range(1, n):
+        idom[vertex[w]] = vertex[doms[w]]
+    return idom
+
+
+# Algorithms for the immediate dominators. 'chk': Cooper, Harvey & Kennedy (iterative); 'lt': semi-NCA (Lengauer-Tarjan). 
+IDOM_ALGORITHMS = {'chk': find_idom, 'lt': find_idom_lt}
+
+
+class DomSets(Mapping):
+    '''
+    The dominators of every block, as a read-only dict (Key: block label; Value: *set* of block labels), built from the idom array. 
+    The set of a block is only built the first time it is looked up (its own label and the set of its idom), 
+    so callers that only need `idom` never pay for the O(n^2) sets. 
+    A block that is not reachable from the entry is only dominated by itself. 
+    '''
+    def __init__(self, idom: dict):
+        self.idom = idom
+        self.sets = dict()
+
+    def __getitem__(self, label: str) -> set:
+        if label not in self.sets:
+            if label not in self.idom:
+                raise KeyError(label)
+            # walk up to the first block whose set is known, then build the sets on the way back down
+            chain = [label]
+            parent = self.idom[label]
+            while parent is not None and parent not in self.sets:
+                chain.append(parent)
+                parent = self.idom[parent]
+            above = self.sets[parent] if parent is not None else set()
+            for node in reversed(chain):
+                above = above | {node}
+                self.sets[node] = above
+        return self.sets[label]
+
+    def __iter__(self):
+        return iter(self.idom)
 
-            # print(f"Block_Label: {block_label}, dom: {dom}")
+    def __len__(self):
+        return len(self.idom)
 
-        if changed == False:
-            break   
- 
-    return dom
\ No newline at end of file
+
+def find_dom(cfg: CFG, algorithm: str = 'chk') -> DomSets:
+    '''
+    Algorithm for Finding Dominators. 
+    A dominates B iff all paths from the entry to B include A. --> A is the dominator of B. 
+
+    Arguments: 
+        cfg: CFG of the function. 
+        algorithm: how the immediate dominators are computed (see IDOM_ALGORITHMS). 
+    Return: 
+        dom: DomSets. Key: block label; Value: *set* of block labels. `dom.idom` is the immediate dominator of each block (see find_idom). 
+    Note that block labels are all unique. 
+    '''
+    if algorithm not in IDOM_ALGORITHMS:
+        raise ValueError(f"Unknown algorithm: {algorithm}. Available algorithms: {', '.join(IDOM_ALGORITHMS)}")
+    return DomSets(IDOM_ALGORITHMS[algorithm](cfg))
\ No newline at end of file
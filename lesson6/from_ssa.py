@@ -1,16 +1,21 @@
 import json
 import sys
 
-from utils import form_blocks, flatten, fresh
-from cfg import block_map, add_entry, get_succ, get_pred
-from dom import find_dom, get_dom_tree, get_dom_frontier
+from utils import flatten
+from manager import AnalysisManager, CFG_ANALYSES
 
+# from_ssa replaces phi nodes by copies in the predecessors: the blocks and the edges between them stay the same. 
+PRESERVES = ('symbols',) + CFG_ANALYSES
+
+
+def from_ssa(func, am: AnalysisManager = None):
+    if am is None:
+        am = AnalysisManager()
 
-def from_ssa(func):
     # function input args
     func_args = func.get('args', [])
 
-    blocks = block_map(list(form_blocks(func['instrs'])))
+    blocks = am.get('cfg', func).blocks
 
 
     def add_id_instr(arg, label, instr):
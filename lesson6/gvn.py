@@ -0,0 +1,235 @@
+import json
+import sys
+
+from utils import flatten
+from manager import AnalysisManager, CFG_ANALYSES
+
+# Global value numbering on SSA form (dominator-based value numbering).
+#
+# Walk the dominator tree in preorder with a scoped hash table. A value computed
+# in a block is available in every block it dominates, so an expression that is
+# already in the table when we reach it is fully redundant: delete it and use the
+# variable that holds the value instead. When we leave a subtree, everything it
+# added to the tables is undone.
+#
+# The input must be in SSA form (e.g. the output of to_ssa.py): every variable has
+# exactly one definition, and that definition dominates all of its uses.
+#
+# from_ssa.py turns a phi into copies at the end of every predecessor of its block,
+# one after the other, so after it a phi dest is assigned again on each of those edges.
+# A use is only renamed to a phi dest inside the body of that phi's block (never in a
+# phi arg, nor past the block): otherwise the copies could overwrite it before the use.
+
+# GVN only deletes instructions and rewrites args: the blocks and the edges between them stay the same.
+PRESERVES = ('symbols',) + CFG_ANALYSES
+
+# Ops without side effects, whose result only depends on the args (and on `value` for const).
+PURE_OPS = {
+    'const', 'id',
+    'add', 'mul', 'sub', 'div',
+    'eq', 'lt', 'gt', 'le', 'ge', 'ne',
+    'not', 'and', 'or',
+    'fadd', 'fmul', 'fsub', 'fdiv', 'feq', 'flt', 'fle', 'fgt', 'fge',
+    'ptradd',
+}
+
+# Ops whose result doesn't depend on the order of the args.
+COMMUTATIVE_OPS = {'add', 'mul', 'eq', 'and', 'or', 'fadd', 'fmul', 'feq'}
+
+_MISSING = object()
+
+
+class ScopedDict:
+    '''
+    A dict with an undo log, for the scoped hash tables of the dominator tree walk.
+    `mark()` returns the current position of the log; `undo(mark)` reverts every assignment made after it.
+    '''
+    def __init__(self):
+        self.d = dict()
+        self.log = list()
+
+    def get(self, key, default=None):
+        return self.d.get(key, default)
+
+    def __contains__(self, key):
+        return key in self.d
+
+    def __getitem__(self, key):
+        return self.d[key]
+
+    def __setitem__(self, key, value):
+        self.log.append((key, self.d.get(key, _MISSING)))
+        self.d[key] = value
+
+    def mark(self) -> int:
+        return len(self.log)
+
+    def undo(self, mark: int):
+        while len(self.log) > mark:
+            key, old = self.log.pop()
+            if old is _MISSING:
+                del self.d[key]
+            else:
+                self.d[key] = old
+
+
+def value_key(instr: dict, args: list) -> tuple:
+    '''
+    The hashable key of the value computed by `instr` (with args already value numbered).
+    '''
+    op = instr['op']
+    typ = json.dumps(instr.get('type', None), sort_keys=True) # int 1 and bool true are different values
+    if op == 'const':
+        return (op, typ, instr['value'])
+    if op in COMMUTATIVE_OPS:
+        args = sorted(args)
+    return (op, typ, tuple(args))
+
+
+def gvn(func, am: AnalysisManager = None) -> dict:
+    '''
+    Global Value Numbering of an SSA-form function.
+
+    Data structures:
+        vn: ScopedDict. Key: variable; Value: the variable that holds its value number (itself if it's the first one).
+        table: ScopedDict. Key: value_key of an expression; Value: the variable that holds it.
+
+    Deleted instructions:
+        - `id` copies: uses are renamed to the copied variable.
+        - fully redundant pure expressions: the same value is already computed in a dominating block.
+        - meaningless phis: all args are the same value (ignoring the phi's own dest, e.g. in a loop header).
+        - redundant phis: another phi in the same block has the same args for the same labels.
+    Unless the value is held by a phi dest that the uses can't be renamed to (see can_rename): then the instruction is kept.
+
+    Return: dict of stats. `removed`: number of deleted instructions.
+    '''
+    if am is None:
+        am = AnalysisManager()
+    cfg = am.get('cfg', func)
+    dom_tree = am.get('dom_tree', func)
+    blocks = cfg.blocks
+
+    vn = ScopedDict()
+    table = ScopedDict()
+    renamed = dict() # every rename ever made (not scoped), to fix up blocks that are not in the dominator tree
+    removed = 0
+
+    phi_block = dict() # Key: phi dest; Value: label of its block
+    uses = dict() # Key: variable; Value: set of labels of the blocks that use it outside their phis (None: used by a phi)
+    for label, block in blocks.items():
+        for instr in block:
+            if instr.get('op', None) == 'phi':
+                phi_block[instr['dest']] = label
+            for arg in instr.get('args', []):
+                uses.setdefault(arg, set()).add(None if instr.get('op', None) == 'phi' else label)
+        # in a block that is its own successor, the copies of its phis are inserted before its terminator
+        if label in cfg.succ[label] and block and block[-1].get('op', None) == 'br':
+            for arg in block[-1].get('args', []):
+                uses[arg].add(None)
+
+    def name(var):
+        return vn.get(var, var)
+
+    def can_rename(dest, var):
+        '''Every use of `dest` can become `var`: it's not a phi dest, or `dest` is only used in the body of its block.'''
+        return var not in phi_block or uses.get(dest, set()) <= {phi_block[var]}
+
+    def rename(dest, var):
+        vn[dest] = var
+        renamed[dest] = var
+
+    def number_block(label):
+        nonlocal removed
+        block = blocks[label]
+        new_block = list()
+        for instr in block:
+            if 'op' not in instr: # label
+                new_block.append(instr)
+                continue
+
+            op = instr['op']
+            if 'args' in instr:
+                instr['args'] = [name(arg) for arg in instr['args']]
+            args = instr.get('args', [])
+
+            if op == 'phi':
+                others = set(args) - {instr['dest']}
+                if len(others) == 1 and can_rename(instr['dest'], next(iter(others))): # meaningless phi
+                    rename(instr['dest'], others.pop())
+                    removed += 1
+                    continue
+                key = ('phi', tuple(sorted(zip(instr['labels'], args))))
+                if key in table:
+                    if can_rename(instr['dest'], table[key]): # redundant phi
+                        rename(instr['dest'], table[key])
+                        removed += 1
+                        continue
+                else:
+                    table[key] = instr['dest']
+
+            elif 'dest' in instr and op in PURE_OPS:
+                if op == 'id':
+                    if can_rename(instr['dest'], args[0]): # copy propagation
+                        rename(instr['dest'], args[0])
+                        removed += 1
+                    else:
+                        new_block.append(instr)
+                    continue
+                key = value_key(instr, args)
+                if key in table: # fully redundant
+                    rename(instr['dest'], table[key])
+                    removed += 1
+                    continue
+                table[key] = instr['dest']
+
+            new_block.append(instr)
+        block[:] = new_block # the CFG keeps pointing at the same block lists
+
+        # The args of the successors' phi nodes are used at the end of this block.
+        for succ in cfg.succ[label]:
+            for instr in blocks[succ]:
+                if instr.get('op', None) == 'phi':
+                    for i, phi_label in enumerate(instr['labels']):
+                        if phi_label == label:
+                            instr['args'][i] = name(instr['args'][i])
+
+    # Preorder walk of the dominator tree. An explicit stack, since deep trees would hit the recursion limit.
+    visited = set()
+    stack = [(cfg.entry, None)]
+    while stack:
+        label, mark = stack.pop()
+        if mark is not None: # leaving the subtree of `label`
+            vn.undo(mark[0])
+            table.undo(mark[1])
+            continue
+        visited.add(label)
+        stack.append((label, (vn.mark(), table.mark())))
+        number_block(label)
+        for child in reversed(dom_tree[label]):
+            stack.append((child, None))
+
+    # Blocks that are not reachable from the entry are not in the dominator tree: just rename their uses.
+    def resolve(var):
+        while var in renamed:
+            var = renamed[var]
+        return var
+    for label, block in blocks.items():
+        if label not in visited:
+            for instr in block:
+                if 'args' in instr:
+                    instr['args'] = [resolve(arg) for arg in instr['args']]
+
+    func['instrs'] = flatten(blocks.values())
+    return {'removed': removed}
+
+
+if __name__ == "__main__":
+    stats = '-s' in sys.argv # print how many instructions were removed
+
+    prog = json.load(sys.stdin)
+    for func in prog['functions']:
+        func_stats = gvn(func)
+        if stats:
+            print(f"{func['name']}: removed {func_stats['removed']}", file=sys.stderr)
+
+    print(json.dumps(prog, indent=2, sort_keys=True))
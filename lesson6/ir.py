@@ -0,0 +1,306 @@
+import json
+import sys
+from array import array
+
+from utils import SymbolTable
+
+# A compact, struct-of-arrays representation of a Bril function.
+#
+# Instead of one dict per instruction (straight from `json.load`), every field
+# lives in its own flat column, indexed by the instruction number:
+# - ops: opcode number (see OPCODES).
+# - dests: variable id of the destination, -1 if there is none.
+# - types: type id of the destination, -1 if there is none.
+# - values: index into the constant pool for `const`, -1 otherwise.
+# - args / labels / funcs: one flat buffer each. Instruction i owns the slice
+#   buffer[start[i]:start[i+1]], so there's no per-instruction list.
+#
+# Label instructions are not stored at all: blocks are index ranges over the
+# instruction columns, and a block remembers the label it starts with (-1 for an
+# anonymous block). That's exactly the partition `form_blocks` produces, so
+# `to_json` gives back the original instruction list.
+
+# Opcodes of core Bril and the memory / float / SSA / speculation extensions.
+# Opcodes not in this list are appended to it on the fly when they show up.
+OPCODES = [
+    'const', 'id', 'nop',
+    'add', 'mul', 'sub', 'div',
+    'eq', 'lt', 'gt', 'le', 'ge', 'ne',
+    'not', 'and', 'or',
+    'jmp', 'br', 'call', 'ret', 'print',
+    'alloc', 'free', 'store', 'load', 'ptradd',
+    'fadd', 'fmul', 'fsub', 'fdiv', 'feq', 'flt', 'fle', 'fgt', 'fge',
+    'phi',
+    'speculate', 'commit', 'guard',
+]
+OPCODE_IDS = {op: i for i, op in enumerate(OPCODES)}
+
+# Instructions that terminate a basic block.
+TERMINATORS = 'br', 'jmp', 'ret'
+
+# Keys of an instruction that have their own column. Anything else (e.g. `pos`)
+# is kept in a side table so that round-tripping is lossless.
+_COLUMN_KEYS = {'op', 'dest', 'type', 'value', 'args', 'labels', 'funcs'}
+
+
+def opcode(op: str) -> int:
+    '''Get the opcode number of `op`, registering it if it is new.
+    '''
+    code = OPCODE_IDS.get(op)
+    if code is None:
+        code = len(OPCODES)
+        OPCODES.append(op)
+        OPCODE_IDS[op] = code
+    return code
+
+
+class TypeTable:
+    '''Intern table for Bril types: maps types to dense integer ids and back.
+    Parameterized types (e.g. `{"ptr": "int"}`) are dicts, so they are keyed by their JSON encoding.
+    '''
+    def __init__(self):
+        self.ids = dict()
+        self.keys = list()
+
+    def intern(self, typ) -> int:
+        key = typ if isinstance(typ, str) else json.dumps(typ, sort_keys=True)
+        id = self.ids.get(key)
+        if id is None:
+            id = len(self.keys)
+            self.ids[key] = id
+            self.keys.append(typ)
+        return id
+
+    def __getitem__(self, id):
+        return self.keys[id]
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class CompactFunc:
+    '''A Bril function stored as flat columns. See the comment at the top of the file.
+
+    Variables and labels are interned to integer ids by the function's SymbolTable
+    (`vars` / `label_names` are its two namespaces); types are interned in the
+    program-wide `type_table`.
+    '''
+    def __init__(self, name: str, type_table: TypeTable):
+        self.name = name
+        self.type_table = type_table
+        self.symbols = SymbolTable()
+        self.vars = self.symbols.vars
+        self.label_names = self.symbols.labels
+        self.params = list() # list of (var id, type id)
+        self.ret_type = -1
+        self.extra_keys = dict() # function-level keys we don't model
+
+        self.ops = array('H')
+        self.dests = array('i')
+        self.types = array('i')
+        self.values = array('i')
+        self.consts = list() # constant pool
+        self.arg_start = array('I', [0])
+        self.args = array('i')
+        self.label_start = array('I', [0])
+        self.labels = array('i')
+        self.func_start = array('I', [0])
+        self.funcs = list() # callee names, rare enough to keep as strings
+        self.extra = dict() # instr index -> dict of keys we don't model
+
+        # Blocks: block b covers instructions [block_start[b], block_start[b+1]).
+        self.block_start = array('I', [0])
+        self.block_label = array('i')
+
+    # ---- construction ----
+
+    @classmethod
+    def from_json(cls, func: dict, type_table: TypeTable):
+        '''Build a CompactFunc from a function in Bril JSON.
+        '''
+        cf = cls(func['name'], type_table)
+        for func_arg in func.get('args', []):
+            cf.params.append((cf.vars.intern(func_arg['name']), type_table.intern(func_arg['type'])))
+        if 'type' in func:
+            cf.ret_type = type_table.intern(func['type'])
+        for key, value in func.items():
+            if key not in ('name', 'args', 'type', 'instrs'):
+                cf.extra_keys[key] = value
+
+        open_block = False # True if the current block may still take instructions
+        for instr in func['instrs']:
+            if 'op' in instr:
+                if not open_block:
+                    cf._start_block(-1)
+                cf.append(instr)
+                open_block = instr['op'] not in TERMINATORS
+            else: # This is a label: it always starts a new block
+                cf._start_block(cf.label_names.intern(instr['label']))
+                open_block = True
+        return cf
+
+    def _start_block(self, label: int):
+        if len(self.block_label) > 0:
+            self.block_start.append(len(self.ops))
+        self.block_label.append(label)
+
+    def append(self, instr: dict) -> int:
+        '''Append one JSON instruction to the columns of the current block. Return its index.
+        '''
+        index = len(self.ops)
+        self.ops.append(opcode(instr['op']))
+        self.dests.append(self.vars.intern(instr['dest']) if 'dest' in instr else -1)
+        self.types.append(self.type_table.intern(instr['type']) if 'type' in instr else -1)
+        if 'value' in instr:
+            self.values.append(len(self.consts))
+            self.consts.append(instr['value'])
+        else:
+            self.values.append(-1)
+
+        intern_var = self.vars.intern
+        self.args.extend(intern_var(arg) for arg in instr.get('args', ()))
+        self.arg_start.append(len(self.args))
+        intern_label = self.label_names.intern
+        self.labels.extend(intern_label(label) for label in instr.get('labels', ()))
+        self.label_start.append(len(self.labels))
+        self.funcs.extend(instr.get('funcs', ()))
+        self.func_start.append(len(self.funcs))
+
+        if len(instr) > len(_COLUMN_KEYS & instr.keys()):
+            self.extra[index] = {k: v for k, v in instr.items() if k not in _COLUMN_KEYS}
+        return index
+
+    # ---- queries ----
+
+    def __len__(self):
+        return len(self.ops)
+
+    def num_blocks(self) -> int:
+        return len(self.block_label)
+
+    def block_range(self, b: int) -> range:
+        '''Instruction indices of block `b`.
+        '''
+        end = self.block_start[b + 1] if b + 1 < len(self.block_start) else len(self.ops)
+        return range(self.block_start[b], end)
+
+    def op(self, i: int) -> str:
+        return OPCODES[self.ops[i]]
+
+    def arg_ids(self, i: int) -> array:
+        return self.args[self.arg_start[i]:self.arg_start[i + 1]]
+
+    def label_ids(self, i: int) -> array:
+        return self.labels[self.label_start[i]:self.label_start[i + 1]]
+
+    def uses(self, i: int):
+        '''Iterate over the variable ids read by instruction `i` without copying.
+        '''
+        args = self.args
+        for k in range(self.arg_start[i], self.arg_start[i + 1]):
+            yield args[k]
+
+    # ---- back to JSON ----
+
+    def instr(self, i: int) -> dict:
+        '''Materialize instruction `i` as a Bril JSON dict.
+        '''
+        instr = {'op': OPCODES[self.ops[i]]}
+        if self.dests[i] >= 0:
+            instr['dest'] = self.vars[self.dests[i]]
+        if self.types[i] >= 0:
+            instr['type'] = self.type_table[self.types[i]]
+        if self.values[i] >= 0:
+            instr['value'] = self.consts[self.values[i]]
+        start, end = self.arg_start[i], self.arg_start[i + 1]
+        if start != end:
+            instr['args'] = [self.vars[v] for v in self.args[start:end]]
+        start, end = self.label_start[i], self.label_start[i + 1]
+        if start != end:
+            instr['labels'] = [self.label_names[l] for l in self.labels[start:end]]
+        start, end = self.func_start[i], self.func_start[i + 1]
+        if start != end:
+            instr['funcs'] = self.funcs[start:end]
+        if i in self.extra:
+            instr.update(self.extra[i])
+        return instr
+
+    def block(self, b: int) -> list:
+        '''Materialize block `b` as a list of JSON instructions, label first (if any).
+        Same shape as the blocks yielded by `form_blocks`.
+        '''
+        block = list()
+        if self.block_label[b] >= 0:
+            block.append({'label': self.label_names[self.block_label[b]]})
+        block.extend(self.instr(i) for i in self.block_range(b))
+        return block
+
+    def blocks(self):
+        '''Generate every block as a list of JSON instructions.
+        '''
+        for b in range(self.num_blocks()):
+            yield self.block(b)
+
+    def to_json(self) -> dict:
+        func = {'name': self.name}
+        if self.params:
+            func['args'] = [{'name': self.vars[v], 'type': self.type_table[t]} for v, t in self.params]
+        if self.ret_type >= 0:
+            func['type'] = self.type_table[self.ret_type]
+        func.update(self.extra_keys)
+        func['instrs'] = [instr for block in self.blocks() for instr in block]
+        return func
+
+
+class CompactProgram:
+    '''A Bril program whose functions are stored as CompactFuncs sharing one type table.
+    '''
+    def __init__(self):
+        self.type_table = TypeTable()
+        self.functions = list()
+        self.extra_keys = dict()
+
+    @classmethod
+    def from_json(cls, prog: dict):
+        cp = cls()
+        for func in prog['functions']:
+            cp.functions.append(CompactFunc.from_json(func, cp.type_table))
+        for key, value in prog.items():
+            if key != 'functions':
+                cp.extra_keys[key] = value
+        return cp
+
+    def to_json(self) -> dict:
+        prog = {'functions': [func.to_json() for func in self.functions]}
+        prog.update(self.extra_keys)
+        return prog
+
+
+def load(fp) -> CompactProgram:
+    '''Read a Bril JSON program from a file object straight into the compact form.
+    '''
+    return CompactProgram.from_json(json.load(fp))
+
+
+def dump(cp: CompactProgram, fp, indent=None):
+    json.dump(cp.to_json(), fp, indent=indent)
+
+
+def run_dict_pass(cp: CompactProgram, func_pass) -> CompactProgram:
+    '''Adapter for passes that still work on JSON dicts, so they can move over
+    to the compact IR one at a time.
+
+    Each function is materialized as a JSON dict, handed to `func_pass(func)`
+    (which mutates it in place, like every pass in this repo), then compacted again.
+    '''
+    for i, cf in enumerate(cp.functions):
+        func = cf.to_json()
+        func_pass(func)
+        cp.functions[i] = CompactFunc.from_json(func, cp.type_table)
+    return cp
+
+
+if __name__ == "__main__":
+    # Round trip: Bril JSON -> compact IR -> Bril JSON
+    cp = load(sys.stdin)
+    dump(cp, sys.stdout, indent=2)
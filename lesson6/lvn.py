@@ -0,0 +1,480 @@
+import json
+import math
+import sys
+from collections import namedtuple
+from utils import form_blocks, flatten, SymbolTable
+
+# cloud = dict() # key: variable; value: #
+# table = dict() # key: #; value: (VAL, HOME)
+
+# table = mapping from value tuples to canonical variables, with each row numbered
+# var2num = mapping from variable names to their current value numbers
+
+# table: a List that is indexed by the *NUMBER*. The value is Tuple = (*VALUE*, *Variable*). *VALUE* is a namedtuple, containing *op*, *args*, *value*
+# var2num: a Dict with the key as variable (in program) and the value as *NUMBER*. 
+# value2num: a Dict with the key as the canonical *VALUE* and the value as the (first) *NUMBER* holding it. It indexes the table, so lookups are O(1). 
+
+
+Value = namedtuple('Value', ['op', 'args'])
+
+# Analyses (see lesson6/manager.py) that are still valid after this pass: the names it adds are interned in the symbol table. 
+PRESERVES = ('symbols',)
+
+# Ops whose result doesn't depend on the order of the args. 
+COMMUTATIVE_OPS = 'add', 'mul', 'eq', 'and', 'or'
+
+# Values that are never looked up in the table: every const gets its own number, and so does every function argument. 
+# `alloc` and `call` are not pure: two of them with the same args are still different values. 
+# `load` is not pure either: its value depends on the memory, which is tracked separately (see `memory` in lvn_block). 
+UNSEARCHED_OPS = 'const', 'func_arg', 'alloc', 'call', 'load'
+
+def canonical(val: Value, commute: bool) -> Value:
+    '''The hashable key of a Value in `value2num`. 
+    With commutativity, the args of commutative ops are sorted, so that `add a b` and `add b a` get the same key. 
+    '''
+    args = tuple(val.args)
+    if commute and val.op in COMMUTATIVE_OPS:
+        args = tuple(sorted(args))
+    return Value(val.op, args)
+
+def find(table, value2num, val, prop, commute):
+    '''find the *num* and *var* in the table if exists, according to the *val*
+    '''
+
+    if prop:
+        # Constant Propagation
+        if val.op == 'id':
+            num = val.args[0]
+            return True, (num, None)
+
+    if val.op not in UNSEARCHED_OPS: # we don't search for CONST op. We just directly put the const value into the table. 
+        num = value2num.get(canonical(val, commute), None)
+        if num is not None:
+            # found (num, var) according to the value in the table
+            var = table[num][1]
+            if (DEBUG):
+                print(f'Found value in the table!  Var: {var}, Num: {num}')
+            return True, (num, var)
+
+    return False, (None, None)
+
+def add_to_table(table, value2num, val, dest, commute) -> int:
+    '''Add a new row (val, dest) into the table and index it. Return its number. 
+    If the same value is already in the table, the index keeps pointing at the first row, like a scan from the top would. 
+    '''
+    num = len(table)
+    table.append((val, dest))
+    if val.op not in UNSEARCHED_OPS:
+        value2num.setdefault(canonical(val, commute), num)
+    return num
+
+def int_div(a: int, b: int) -> int:
+    '''Bril `div` rounds toward zero (Python's // rounds down: -7 // 2 == -4, but -7 / 2 is -3 in Bril). 
+    '''
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+FOLDABLE_OPS = {
+    'add': lambda a, b: a + b,
+    'mul': lambda a, b: a * b,
+    'sub': lambda a, b: a - b,
+    'div': int_div,
+    'gt': lambda a, b: a > b,
+    'lt': lambda a, b: a < b,
+    'ge': lambda a, b: a >= b,
+    'le': lambda a, b: a <= b,
+    'ne': lambda a, b: a != b,
+    'eq': lambda a, b: a == b,
+    'or': lambda a, b: a or b,
+    'and': lambda a, b: a and b,
+    'not': lambda a: not a,
+    # float extension
+    'fadd': lambda a, b: a + b,
+    'fmul': lambda a, b: a * b,
+    'fsub': lambda a, b: a - b,
+    'fdiv': lambda a, b: a / b,
+    'feq': lambda a, b: a == b,
+    'flt': lambda a, b: a < b,
+    'fle': lambda a, b: a <= b,
+    'fgt': lambda a, b: a > b,
+    'fge': lambda a, b: a >= b,
+}
+
+# Division by a constant zero is left for the interpreter to report (or, for floats, to produce inf / nan). 
+DIVIDE_OPS = 'div', 'fdiv'
+
+INT_BITS = 64
+
+def wrap(value):
+    '''Bril ints are 64-bit two's complement. 
+    '''
+    if type(value) is int:
+        value = (value + (1 << (INT_BITS - 1))) % (1 << INT_BITS) - (1 << (INT_BITS - 1))
+    return value
+
+def eval_const(op: str, args: list):
+    '''Evaluate a foldable op on constant args, the way Bril does. Also used by sccp.py, so both passes fold to the same constants. 
+
+    Return: the constant, or None if it has to be left for run time: division by zero, or a float result that is not finite 
+    (inf and nan have no JSON constant). 
+    '''
+    if op in DIVIDE_OPS and args[1] == 0:
+        return None
+    result = FOLDABLE_OPS[op](*args)
+    if isinstance(result, float) and not math.isfinite(result):
+        return None
+    return wrap(result)
+
+def const_fold(value, num2const):
+    '''Compute the result as constant value if the args are constants. Transform the instruction into *const* inst. 
+    Add (num, value) key-value pair into num2const.  
+
+    Return: constant result if it is foldable. Otherwise return None. 
+    '''
+
+    # Special cases: 
+    # for Comparison op: gt, lt, ge, le, ne, eq. 
+    # If value.arg[0] == value.arg[1], (e.g. 'arg1' == 'arg1'), even it is not a constant arg, we should fold and give constant result. 
+    if value.op in ['gt', 'lt', 'ge', 'le', 'ne', 'eq']:
+        if value.args[0] == value.args[1]:
+            const_args = [0, 0] # give any two args with the same value
+            return FOLDABLE_OPS[value.op](*const_args)
+
+    # for Logic op: and, or
+    if value.op == 'and':
+        for arg in value.args:
+            const_arg = num2const.get(arg, None) # if arg is not in num2const Dict, const_arg = None
+            if const_arg == False:
+                return False
+
+    if value.op == 'or':
+        for arg in value.args:
+            const_arg = num2const.get(arg, None) # if arg is not in num2const Dict, const_arg = None
+            if const_arg == True:
+                return True
+
+    args_are_const = True
+    for arg in value.args:
+        if arg not in num2const:
+            args_are_const = False
+            break
+
+    if (args_are_const) and (value.op in FOLDABLE_OPS):
+        const_args = [num2const[arg] for arg in value.args]
+        return eval_const(value.op, const_args)
+    
+    else:
+        return None
+
+
+
+def simplify(value, num2const):
+    '''Algebraic identities and strength reduction on the value numbers of an int / bool op, for when the args are not all constants. 
+    Float ops are never simplified: identities like `x + 0.0 = x` or `x - x = 0.0` don't hold for -0.0, inf and nan. 
+
+    Return: one of
+        ('same', num): the result is the value numbered `num` (e.g. `x * 1`). 
+        ('const', c): the result is the constant c (e.g. `x - x`). 
+        ('value', Value): the same result computed by a cheaper op (`x * 2` -> `x + x`). 
+        None: nothing to simplify. 
+    '''
+    op = value.op
+    if len(value.args) != 2:
+        return None
+    a, b = value.args
+    const_a = num2const.get(a, None)
+    const_b = num2const.get(b, None)
+
+    if op == 'add':
+        if const_b == 0:
+            return ('same', a)
+        if const_a == 0:
+            return ('same', b)
+    elif op == 'sub':
+        if const_b == 0:
+            return ('same', a)
+        if a == b:
+            return ('const', 0)
+    elif op == 'mul':
+        if const_a == 0 or const_b == 0:
+            return ('const', 0)
+        if const_b == 1:
+            return ('same', a)
+        if const_a == 1:
+            return ('same', b)
+        if const_b == 2:
+            return ('value', Value('add', [a, a]))
+        if const_a == 2:
+            return ('value', Value('add', [b, b]))
+    elif op == 'div':
+        if const_b == 1:
+            return ('same', a)
+    elif op == 'and':
+        if const_b is True or a == b:
+            return ('same', a)
+        if const_a is True:
+            return ('same', b)
+    elif op == 'or':
+        if const_b is False or a == b:
+            return ('same', a)
+        if const_a is False:
+            return ('same', b)
+    elif op in ('eq', 'le', 'ge'):
+        if a == b:
+            return ('const', True)
+    elif op in ('ne', 'lt', 'gt'):
+        if a == b:
+            return ('const', False)
+    return None
+
+
+def clobber(mem, num2base, ptr):
+    '''A store through `ptr` may overwrite what we know about the memory: drop every entry of `mem` that may alias `ptr`. 
+    Two pointers may alias unless they come from two different `alloc`s of this block (`num2base`). 
+    '''
+    base = num2base.get(ptr, None)
+    if base is None:
+        mem.clear()
+        return
+    for p in list(mem):
+        if num2base.get(p, None) in (None, base):
+            del mem[p]
+
+
+def change_overwritten_name(block, symbols):
+    '''Loop once to change the names of overwritten variables. Note that When we change one variable's name, we need to change all the following argument's name that use this variable. 
+    Therefore, we need to track where those dest variables are used. 
+    Fresh names are generated by `symbols` (the SymbolTable of the function). 
+    '''
+    last_write = dict() # key: dest variable; value: instr number that writes to the dest variable
+    # When we change one variable's name, we need to change all the following argument's name that use this variable
+    used_instr = dict() # key: overwritten variable; value: List containing the instr number that used the overwritten variable. 
+    used_args = dict() # corresponding to the `used_instr`. key: overwritten variable; value: List consists of list, showing which argument(s) is (are) used in each used instr. 
+
+    # loop once: generate names for the overwritten dest, so that we can avoid wrong argument substitutions
+    for instr_index, instr in enumerate(block):
+        # Check Used Arguments First. 
+        # Otherwise, for testcases like: `a = 4; a = a + 1`, it would transform to 'lvn.0 = 4; a = a + 1'. 
+        # The correct transformation should be `lvn.0 = 4; a = lvn.0 + 1`
+        if 'args' in instr:
+            # args_list = list() # used args index for each used_instr. E.g. sum1: int = add a a; If a is written before, args_list will be [0,0]
+            for arg_index, arg in enumerate(instr['args']):
+                if arg in last_write:
+                    # args_list.append(i)
+                    if arg not in used_instr:
+                        used_instr[arg] = list()
+                        used_args[arg] = list()
+
+                    used_instr[arg].append(instr_index)
+                    used_args[arg].append(arg_index)
+
+        # Check Written Variables
+        if 'dest' in instr:
+            dest = instr['dest']
+
+            if dest in last_write.keys(): # if instr (its index is last_write[dest]) is overwritten #TODO: this should be examines for every instr? 
+                # print(f"Found in Last Write, Dest: {dest}")
+                lvn_name = symbols.vars.fresh('lvn') # generate a fresh variable name
+                block[last_write[dest]]['dest'] = lvn_name # change the dest name of the overwritten variable
+                
+                instr_id_list = used_instr.get(dest, [])
+                arg_id_list = used_args.get(dest, [])
+
+                for i, instr_id in enumerate(instr_id_list):
+                    block[instr_id]['args'][arg_id_list[i]] = lvn_name
+
+                # clean used_instr, used_args
+                used_instr.pop(dest, None)
+                used_args.pop(dest, None)
+            
+            last_write[dest] = instr_index
+
+def lvn(func, prop, commute, fold, symbols=None, algebra=False, memory=False):
+    '''Local Value Numbering. 
+    `symbols` is the SymbolTable of the function, if some other pass already built it. 
+    `algebra` enables algebraic simplification and strength reduction (see `simplify`). 
+    `memory` enables redundant load elimination and store-to-load forwarding. 
+    '''
+    # deal with functions with args
+    func_args = func.get('args', [])
+    if symbols is None:
+        symbols = SymbolTable.from_func(func)
+    blocks = list(form_blocks(func['instrs']))
+    for block in blocks:
+        lvn_block(block, func_args, symbols, prop, commute, fold, algebra, memory)
+    func['instrs'] = flatten(blocks)
+
+
+def lvn_block(block, func_args, symbols, prop, commute, fold, algebra=False, memory=False):
+    '''Local Value Numbering for each blocks. 
+    '''
+    
+    # a List that is indexed by the *NUMBER*. The value is Tuple = (*VALUE*, *Variable*). *VALUE* is a namedtuple, containing *op*, *args*, *value*
+    table = list()
+    # Key: canonical *VALUE*. Value: number in the Table. 
+    value2num = dict()
+    # Key: current number index of every defined variable. Value: number in the Table. Different variables can have the same number in the Table. 
+    var2num = dict()
+    # Key: number in the Table. Value: const value (if the value of variable could be computed)
+    num2const = dict()
+    # Memory Value Numbering. Key: number of a pointer. Value: number of the value we know it points to (stored or loaded before). 
+    mem = dict()
+    # Key: number of a pointer. Value: number of the `alloc` it points into, if it was allocated in this block. 
+    num2base = dict()
+
+    # loop once to change the names of overwritten variables
+    change_overwritten_name(block, symbols)
+
+    # if func has args, put each arg into one row of table. Give each a number. var2num. table. 
+    for func_arg in func_args:
+        pseudo_op = 'func_arg'
+        pseudo_args = list()
+
+        val = Value(pseudo_op, pseudo_args)
+        dest = func_arg['name']
+        num = add_to_table(table, value2num, val, dest, commute)
+        
+        var2num[dest] = num
+
+
+    for instr in block:
+
+        if 'op' in instr: # if this is an operation
+
+            val_op = instr['op']
+            argsvar = instr.get('args', [])
+            argsnum = [var2num[argvar] for argvar in argsvar]
+
+            # generate Value object
+            val = Value(val_op, argsnum) # TODO: some op don't have args. Like `ret`, `const`
+
+            # find the *num* and *var* in the table if exists, according to the *val*
+            found, (num, var) = find(table, value2num, val, prop, commute)
+
+            # Memory Value Numbering: a load of a pointer whose contents are known is the known value
+            if memory:
+                if val_op == 'load' and argsnum[0] in mem:
+                    num = mem[argsnum[0]]
+                    found, (num, var) = True, (num, table[num][1])
+                elif val_op == 'store':
+                    clobber(mem, num2base, argsnum[0])
+                    mem[argsnum[0]] = argsnum[1]
+                elif val_op in ('call', 'free'): # a callee can store through any pointer it can reach
+                    mem.clear()
+
+            # Algebraic Simplification: the value may be equal to one we already have, or to a constant, or to a cheaper op
+            simple_const = None
+            if not found and algebra:
+                simple = simplify(val, num2const)
+                if simple is not None:
+                    kind, result = simple
+                    if kind == 'same':
+                        found, (num, var) = True, (result, table[result][1])
+                    elif kind == 'const':
+                        simple_const = result
+                    else: # strength reduction: rewrite the instr, then look the cheaper value up
+                        instr['op'] = result.op
+                        instr['args'] = [argsvar[argsnum.index(arg)] for arg in result.args]
+                        val = result
+                        found, (num, var) = find(table, value2num, val, prop, commute)
+
+            if DEBUG:
+                print(f'found: {found}, num: {num}, var: {var}')
+
+                    
+            if found: # value is in the table
+                # current instr is 'id', returned *num* holds a constant value
+
+                # Replace instr with constant op
+                if num in num2const:
+                    const_value = num2const[num]
+                    instr.update({
+                        'op': 'const',
+                        'value': const_value,
+                    })
+                    instr.pop('args', None)
+
+                else:
+                    # Replace instr with copy of var
+                    instr.update({
+                        'op': 'id',
+                        'args': [var]
+                    })
+
+            else: # value not in table
+                num = len(table)
+
+                # Constant Folding: Compute the constant value if the *args* are all in num2constant. Compute based on the *op*
+                const_result = simple_const
+                if fold and const_result is None:
+                    const_result = const_fold(val, num2const) # compute the constant value, and put it into num2const Dict
+
+                # update instruction: transform inst to *const*
+                if const_result != None:
+                    instr.update({
+                        'op': 'const',
+                        'value': const_result,
+                    })
+                    instr.pop('args', None)
+
+                if DEBUG:
+                    print("Const Result: ", const_result)
+
+
+                if 'dest' in instr:
+                    dest = instr['dest']
+
+                    # Record constant values
+                    if instr['op'] == 'const':
+                        num2const[num] = instr['value'] # update num2const
+
+                    add_to_table(table, value2num, val, dest, commute) # add a new line into table
+
+                # Replace the args of the instr
+                if 'args' in instr:
+                    new_args = list()
+                    for arg in instr['args']:
+                        new_args.append(table[var2num[arg]][1])
+                    instr['args'] = new_args
+            
+            # Update var2num dict
+            if 'dest' in instr:
+                var2num[instr['dest']] = num
+
+            if memory:
+                if val_op == 'load':
+                    mem[argsnum[0]] = num # a repeated load gets the same value until the next clobber
+                elif val_op == 'alloc':
+                    num2base[num] = num
+                elif val_op == 'ptradd' and argsnum[0] in num2base:
+                    num2base[num] = num2base[argsnum[0]]
+
+            if DEBUG:
+                print("Value: {}, Var: {}".format(val, dest))
+                print("var2num: ", var2num)
+                print("num2const: ", num2const)
+                print("\n")
+
+
+        else: # this is a label. Label can only appear at the start of the block. 
+            pass
+
+
+
+DEBUG = False
+
+
+
+if __name__ == "__main__":
+    prop = True if '-p' in sys.argv else False # constant propagation
+    commute = True if '-c' in sys.argv else False # commutativity
+    fold = True if '-f' in sys.argv else False # constant folding
+    algebra = True if '-a' in sys.argv else False # algebraic simplification and strength reduction
+    memory = True if '-m' in sys.argv else False # redundant load elimination and store-to-load forwarding
+
+    prog = json.load(sys.stdin)
+    for func in prog['functions']:
+        lvn(func, prop=prop, commute=commute, fold=fold, algebra=algebra, memory=memory)
+
+    # Emit JSON IR
+    json.dump(prog, sys.stdout, indent=2)
@@ -0,0 +1,83 @@
+from collections import namedtuple
+
+from utils import form_blocks, SymbolTable
+from cfg import CFG, block_map, add_entry, add_terminators
+from dom import find_dom, get_dom_tree, get_dom_frontier
+from df import ANALYSIS, solve_df, reaching_defs
+
+# Analysis manager, in the spirit of LLVM's: analyses of a function are computed
+# lazily, cached per function, and only dropped when a transform says it doesn't
+# preserve them.
+#
+# A single analysis consists of these parts:
+# - deps: names of the analyses it is computed from. If one of them is dropped, so is this one.
+# - compute: function(am, func) that computes the result.
+AnalysisInfo = namedtuple('AnalysisInfo', ['deps', 'compute'])
+
+
+def compute_cfg(am, func) -> CFG:
+    '''
+    CFG of the function in the shape to_ssa works on: named blocks, a unique entry block, and a terminator in every block.
+    Transforms that preserve 'cfg' must edit `cfg.blocks` in place and write them back with `func['instrs'] = flatten(cfg.blocks.values())`.
+    '''
+    blocks = block_map(list(form_blocks(func['instrs'])))
+    add_entry(blocks)
+    add_terminators(blocks)
+    return CFG(blocks)
+
+
+def compute_live(am, func):
+    '''
+    Live variables of every block: (In, Out), using the dataflow framework in df.py.
+    '''
+    return solve_df(am.get('cfg', func), ANALYSIS['live'])
+
+
+ANALYSES = {
+    'symbols': AnalysisInfo((), lambda am, func: SymbolTable.from_func(func)),
+    'cfg': AnalysisInfo((), compute_cfg),
+    'dom': AnalysisInfo(('cfg',), lambda am, func: find_dom(am.get('cfg', func))),
+    'dom_tree': AnalysisInfo(('dom',), lambda am, func: get_dom_tree(am.get('dom', func))),
+    'frontier': AnalysisInfo(('dom', 'cfg'), lambda am, func: get_dom_frontier(am.get('dom', func), am.get('cfg', func))),
+    'live': AnalysisInfo(('cfg',), compute_live),
+    'reaching': AnalysisInfo(('cfg',), lambda am, func: reaching_defs(am.get('cfg', func), func.get('args', []))),
+}
+
+# Everything that only depends on the shape of the CFG (not on the instructions inside the blocks).
+CFG_ANALYSES = ('cfg', 'dom', 'dom_tree', 'frontier')
+
+
+class AnalysisManager:
+    '''
+    Cache of analysis results. Key: function name; Value: dict(analysis name -> result).
+    '''
+    def __init__(self):
+        self.cache = dict()
+        self.computed = dict() # analysis name -> number of times it was computed. Handy to check what caching saves.
+
+    def get(self, name: str, func: dict):
+        '''
+        Get analysis `name` of `func`, computing it (and whatever it depends on) if it's not cached.
+        '''
+        results = self.cache.setdefault(func['name'], dict())
+        if name not in results:
+            results[name] = ANALYSES[name].compute(self, func)
+            self.computed[name] = self.computed.get(name, 0) + 1
+        return results[name]
+
+    def invalidate(self, func: dict, preserved=()):
+        '''
+        Called after a transform changed `func`. Keep the analyses in `preserved` (and still valid: all their
+        dependencies are kept too), drop everything else.
+        '''
+        results = self.cache.get(func['name'], None)
+        if not results:
+            return
+        kept = dict()
+        for name in ANALYSES: # dependencies come before the analyses using them
+            if name in results and name in preserved and all(dep in kept for dep in ANALYSES[name].deps):
+                kept[name] = results[name]
+        self.cache[func['name']] = kept
+
+    def clear(self):
+        self.cache.clear()
@@ -0,0 +1,220 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import socketserver
+import sys
+
+from collections import namedtuple
+
+import lvn
+import dce
+import to_ssa
+import from_ssa
+import gvn
+import sccp
+import pre
+from manager import AnalysisManager
+
+# Run several passes in one process: the program is loaded once, every pass
+# works on the same JSON object in memory, and it's serialized only at the end.
+#
+#   bril2json < prog.bril | python pipeline.py "lvn -p -c -f, dce+, to_ssa, from_ssa" | bril2txt
+#
+# is the same as
+#
+#   bril2json < prog.bril | python lvn.py -p -c -f | python dce.py dce+ | python to_ssa.py | python from_ssa.py | bril2txt
+
+
+# A single pass consists of these parts:
+# - run: function(func, flags, am) that transforms one function in place. `am` is the AnalysisManager of the pipeline.
+# - preserves: the analyses that are still valid after the pass (declared as PRESERVES in each pass module).
+Pass = namedtuple('Pass', ['run', 'preserves'])
+
+
+def run_lvn(func, flags, am):
+    lvn.lvn(func, prop='-p' in flags, commute='-c' in flags, fold='-f' in flags, symbols=am.get('symbols', func),
+            algebra='-a' in flags, memory='-m' in flags)
+
+# Key: pass name used in the pipeline string; Value: Pass.
+PASSES = {
+    'lvn': Pass(run_lvn, lvn.PRESERVES),
+    'tdce': Pass(lambda func, flags, am: dce.trivial_dce(func), dce.PRESERVES),
+    'dce+': Pass(lambda func, flags, am: dce.plus_dce(func), dce.PRESERVES),
+    'gdce': Pass(lambda func, flags, am: dce.global_dce(func), dce.PRESERVES),
+    'to_ssa': Pass(lambda func, flags, am: to_ssa.to_ssa(func, am), to_ssa.PRESERVES),
+    'from_ssa': Pass(lambda func, flags, am: from_ssa.from_ssa(func, am), from_ssa.PRESERVES),
+    'gvn': Pass(lambda func, flags, am: gvn.gvn(func, am), gvn.PRESERVES),
+    'sccp': Pass(lambda func, flags, am: sccp.sccp(func, am), sccp.PRESERVES),
+    'pre': Pass(lambda func, flags, am: pre.pre(func, am), pre.PRESERVES),
+}
+
+
+def parse_pipeline(pipeline: str) -> list:
+    '''
+    Parse a pipeline string like "lvn -p -c -f, dce+, to_ssa" into a list of (pass name, flags).
+    '''
+    passes = list()
+    for stage in pipeline.split(','):
+        words = stage.split()
+        if not words:
+            continue
+        name, flags = words[0], words[1:]
+        if name not in PASSES:
+            raise ValueError(f"Unknown pass: {name}. Available passes: {', '.join(PASSES)}")
+        passes.append((name, flags))
+    return passes
+
+
+def run_func(func: dict, passes: list, am: AnalysisManager = None) -> dict:
+    '''
+    Run the passes on one function, in order. The function is modified in place.
+    Analyses are shared between the passes through `am`; after each pass, only what it preserves is kept.
+    '''
+    if am is None:
+        am = AnalysisManager()
+    for name, flags in passes:
+        PASSES[name].run(func, flags, am)
+        am.invalidate(func, PASSES[name].preserves)
+    return func
+
+
+def _run_func_task(task: tuple) -> dict:
+    func, passes = task
+    return run_func(func, passes)
+
+
+def run_pipeline(prog: dict, passes: list, pool=None) -> dict:
+    '''
+    Run the passes on every function of the program. The program is modified in place.
+    Every pass here is intraprocedural, so with a process `pool` the functions are optimized in parallel;
+    `pool.map` keeps them in their original order.
+    '''
+    if pool is None or len(prog['functions']) < 2:
+        for func in prog['functions']:
+            run_func(func, passes)
+    else:
+        prog['functions'] = pool.map(_run_func_task, [(func, passes) for func in prog['functions']])
+    return prog
+
+
+def batch_files(pattern: str) -> list:
+    '''
+    Expand a directory (all `*.json` inside it) or a glob into a sorted list of files.
+    '''
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.json')
+    return sorted(glob.glob(pattern))
+
+
+def _run_file_task(task: tuple) -> tuple:
+    path, passes = task
+    try: # a file that can't be read or parsed only fails itself, not the whole batch
+        with open(path) as f:
+            prog = json.load(f)
+        return path, run_pipeline(prog, passes), None
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+
+
+def run_batch(files: list, passes: list, out_dir: str, pool=None) -> int:
+    '''
+    Optimize every file and write the result to `out_dir` under the same file name.
+    With a process `pool`, files are spread across the workers (one file per task); results are still
+    written in sorted file order, so the output doesn't depend on the number of jobs.
+    Return: number of files that failed.
+    '''
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = [(path, passes) for path in files]
+    results = pool.imap(_run_file_task, tasks) if pool is not None else map(_run_file_task, tasks)
+
+    failed = 0
+    for path, prog, error in results:
+        if error is not None:
+            print(f"{path}: {error}", file=sys.stderr)
+            failed += 1
+            continue
+        with open(os.path.join(out_dir, os.path.basename(path)), 'w') as f:
+            json.dump(prog, f)
+    return failed
+
+
+def serve_stream(passes: list, infile, outfile):
+    '''
+    Server loop: read one JSON program per line, write one optimized JSON program per line.
+    A bad program produces an `{"error": ...}` line instead of killing the server.
+    '''
+    for line in infile:
+        if not line.strip():
+            continue
+        try:
+            result = run_pipeline(json.loads(line), passes)
+        except Exception as e:
+            result = {'error': f"{type(e).__name__}: {e}"}
+        outfile.write(json.dumps(result) + '\n')
+        outfile.flush()
+
+
+def serve_socket(passes: list, path: str):
+    '''
+    Same protocol as `serve_stream`, on a local (Unix domain) socket. Each connection gets its own thread.
+    '''
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            serve_stream(passes, (line.decode() for line in self.rfile), _TextWriter(self.wfile))
+
+    if os.path.exists(path):
+        os.remove(path)
+    with socketserver.ThreadingUnixStreamServer(path, Handler) as server:
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(path)
+
+
+class _TextWriter:
+    '''Wrap a binary socket file so `serve_stream` can write str to it.
+    '''
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, s):
+        self.wfile.write(s.encode())
+
+    def flush(self):
+        self.wfile.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run a pipeline of passes in one process.')
+    parser.add_argument('pipeline', help=f"comma separated passes with their flags, e.g. \"lvn -p -c -f, dce+, to_ssa, from_ssa\". Passes: {', '.join(PASSES)}")
+    parser.add_argument('--serve', action='store_true', help='read one JSON program per line from stdin and write one per line to stdout')
+    parser.add_argument('--socket', help='serve on this Unix domain socket path instead of stdin/stdout')
+    parser.add_argument('--indent', type=int, default=None, help='indent the JSON output')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of worker processes (functions, or files in batch mode, are optimized in parallel)')
+    parser.add_argument('--batch', help='a directory or glob of JSON programs to optimize instead of stdin')
+    parser.add_argument('-o', '--out', help='output directory for --batch')
+    args = parser.parse_args()
+
+    passes = parse_pipeline(args.pipeline)
+    if args.batch and not args.out:
+        parser.error('--batch needs an output directory (-o)')
+
+    pool = multiprocessing.Pool(args.jobs) if args.jobs > 1 else None
+    try:
+        if args.batch:
+            failed = run_batch(batch_files(args.batch), passes, args.out, pool)
+            sys.exit(1 if failed else 0)
+        elif args.socket:
+            serve_socket(passes, args.socket)
+        elif args.serve:
+            serve_stream(passes, sys.stdin, sys.stdout)
+        else:
+            prog = json.load(sys.stdin)
+            run_pipeline(prog, passes, pool)
+            json.dump(prog, sys.stdout, indent=args.indent)
+            print()
+    finally:
+        if pool is not None:
+            pool.close()
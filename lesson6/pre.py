@@ -0,0 +1,174 @@
+import json
+import sys
+
+from utils import flatten
+from cfg import CFG, split_critical_edges
+from dom import intersect
+from df import Analysis, solve_df, gen_kill_transfer, union
+from gvn import PURE_OPS, COMMUTATIVE_OPS
+from manager import AnalysisManager
+
+# Partial redundancy elimination by lazy code motion (Knoop, Ruthing & Steffen),
+# in the four-analysis formulation of the Dragon book (section 9.5):
+#
+# 1. anticipated (backward, intersection): e will be computed on every path from here,
+#    before its operands change. Inserting e here can't add work to any path.
+# 2. available (forward, intersection): e is available here if every path computed or
+#    anticipated it, assuming we insert at the earliest anticipated points.
+#    earliest[B] = anticipated.in[B] - available.in[B]
+# 3. postponable (forward, intersection): the insertion can be delayed past this point.
+#    latest[B] is where it can't be delayed any more: e is used in B, or not postponable
+#    into every successor.
+# 4. used (backward, union): the temp holding e is still needed after B.
+#
+# Then `t = e` is inserted at the start of every block in latest & used.out, and the
+# upward-exposed computations of e become `id t` wherever they are redundant. Every path
+# computes e at most as often as before, and as late as possible (short temp lifetimes).
+#
+# Code can only be inserted on a block, so critical edges are split first; the new
+# blocks that got nothing inserted are removed again at the end.
+#
+# The input must not be in SSA form (no phi nodes), e.g. before to_ssa or after from_ssa.
+# Expressions are matched by name: `add a b` in two blocks is the same expression if
+# neither a nor b is redefined in between.
+
+# Splitting edges changes the CFG: only the symbol table is kept (the temps are interned in it).
+PRESERVES = ('symbols',)
+
+# Ops worth moving: the pure ops, except `const` and `id` which are as cheap as the copy that would replace them,
+# and `div` which traps on a zero divisor: computed earlier, it could trap before a side effect (e.g. a `print`)
+# that used to come first.
+MOVABLE_OPS = PURE_OPS - {'const', 'id', 'div'}
+
+
+def expression(instr: dict):
+    '''
+    The expression computed by `instr`: (op, args), with the args of commutative ops sorted. None if it's not movable.
+    '''
+    op = instr.get('op', None)
+    if op not in MOVABLE_OPS or 'dest' not in instr:
+        return None
+    args = tuple(instr.get('args', []))
+    if op in COMMUTATIVE_OPS:
+        args = tuple(sorted(args))
+    return (op, args)
+
+
+def pre(func, am: AnalysisManager = None) -> dict:
+    '''
+    Partial Redundancy Elimination (lazy code motion) of a function.
+
+    Data structures (Key: block label):
+        use: set of the expressions computed in the block before any of their operands is redefined (upward exposed).
+        kill: set of the expressions with an operand defined in the block.
+        latest, earliest: set of expressions, see the comment at the top.
+        temps: dict. Key: expression; Value: the temp variable that holds it.
+
+    Return: dict of stats. `inserted`: computations inserted; `replaced`: computations replaced by a copy of a temp.
+    '''
+    if am is None:
+        am = AnalysisManager()
+    symbols = am.get('symbols', func)
+    blocks = am.get('cfg', func).blocks
+    split = split_critical_edges(blocks, symbols)
+    cfg = CFG(blocks)
+
+    # the universe of expressions, and the expressions each variable is an operand of
+    universe = set()
+    expr_type = dict()
+    var_exprs = dict()
+    for block in blocks.values():
+        for instr in block:
+            e = expression(instr)
+            if e is not None and e not in universe:
+                universe.add(e)
+                expr_type[e] = instr['type']
+                for arg in e[1]:
+                    var_exprs.setdefault(arg, set()).add(e)
+
+    use = dict()
+    kill = dict()
+    for label, block in blocks.items():
+        use[label] = set()
+        defined = set()
+        for instr in block:
+            e = expression(instr)
+            if e is not None and not any(arg in defined for arg in e[1]):
+                use[label].add(e)
+            if 'dest' in instr:
+                defined.add(instr['dest'])
+        kill[label] = union(var_exprs.get(var, set()) for var in defined)
+
+    def label_of(block):
+        return block[0]['label'] # every block in the CFG starts with its label
+
+    anticipated_in, _ = solve_df(cfg, Analysis(False, init=universe, merge=intersect, transfer=gen_kill_transfer,
+        summary=lambda block: (use[label_of(block)], kill[label_of(block)])))
+
+    available_in, _ = solve_df(cfg, Analysis(True, init=universe, merge=intersect, transfer=gen_kill_transfer,
+        summary=lambda block: (anticipated_in[label_of(block)] - kill[label_of(block)], kill[label_of(block)])))
+
+    earliest = {label: anticipated_in[label] - available_in[label] for label in cfg.names}
+
+    postponable_in, _ = solve_df(cfg, Analysis(True, init=universe, merge=intersect, transfer=gen_kill_transfer,
+        summary=lambda block: (earliest[label_of(block)] - use[label_of(block)], use[label_of(block)])))
+
+    latest = dict()
+    for label in cfg.names:
+        candidates = earliest[label] | postponable_in[label]
+        succ_candidates = intersect([earliest[succ] | postponable_in[succ] for succ in cfg.succ[label]])
+        latest[label] = candidates & (use[label] | (universe - succ_candidates))
+
+    _, used_out = solve_df(cfg, Analysis(False, init=set(), merge=union, transfer=gen_kill_transfer,
+        summary=lambda block: (use[label_of(block)] - latest[label_of(block)], latest[label_of(block)])))
+
+    # transform
+    stats = {'inserted': 0, 'replaced': 0}
+    temps = dict()
+    def temp(e):
+        if e not in temps:
+            temps[e] = symbols.vars.fresh('pre')
+        return temps[e]
+
+    for label, block in blocks.items():
+        insert = latest[label] & used_out[label]
+        replace = use[label] & ((universe - latest[label]) | used_out[label])
+
+        defined = set()
+        for instr in block:
+            e = expression(instr)
+            if e is not None and e in replace and not any(arg in defined for arg in e[1]):
+                instr.update({'op': 'id', 'args': [temp(e)]})
+                instr.pop('funcs', None)
+                stats['replaced'] += 1
+            if 'dest' in instr:
+                defined.add(instr['dest'])
+
+        new_instrs = list()
+        for e in sorted(insert):
+            op, args = e
+            new_instrs.append({'op': op, 'dest': temp(e), 'type': expr_type[e], 'args': list(args)})
+        block[1:1] = new_instrs # right after the label
+        stats['inserted'] += len(new_instrs)
+
+    # take out the split blocks that are still empty
+    for label, pred, succ in split:
+        if len(blocks[label]) == 2: # label and jmp
+            terminator = blocks[pred][-1]
+            terminator['labels'] = [succ if l == label else l for l in terminator['labels']]
+            del blocks[label]
+
+    func['instrs'] = flatten(blocks.values())
+    return stats
+
+
+if __name__ == "__main__":
+    stats = '-s' in sys.argv # print how many computations were inserted / replaced
+
+    prog = json.load(sys.stdin)
+    for func in prog['functions']:
+        func_stats = pre(func)
+        if stats:
+            print(f"{func['name']}: inserted {func_stats['inserted']}, replaced {func_stats['replaced']}", file=sys.stderr)
+
+    print(json.dumps(prog, indent=2, sort_keys=True))
@@ -0,0 +1,239 @@
+import json
+import sys
+
+from utils import flatten
+from manager import AnalysisManager
+from lvn import FOLDABLE_OPS, eval_const
+
+# Sparse conditional constant propagation (Wegman & Zadeck) on SSA form.
+#
+# Every variable has a lattice value: TOP (no value seen yet), a constant, or
+# BOTTOM (not a constant). Two worklists drive the analysis:
+# - flow worklist: CFG edges that just became executable. The first time a block is
+#   reached, all its instructions are evaluated; a new edge into a block only
+#   re-evaluates its phi nodes.
+# - ssa worklist: variables whose value just went down the lattice. Only their uses
+#   (def-use edges) are re-evaluated, and only in executable blocks.
+# Each variable goes down the lattice at most twice, so the work is proportional to
+# the number of def-use edges, not to (blocks x passes) like the dense dataflow in df.py.
+#
+# The input must be in SSA form (e.g. the output of to_ssa.py).
+
+# Deleting unreachable blocks and turning `br` into `jmp` changes the CFG: only the symbol table is kept.
+PRESERVES = ('symbols',)
+
+
+class _Lattice:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+TOP = _Lattice('TOP')
+BOTTOM = _Lattice('BOTTOM')
+
+
+def is_const(a) -> bool:
+    return a is not TOP and a is not BOTTOM
+
+
+# Name to_ssa gives to the value of a variable on a path where it is not defined.
+UNDEFINED = '__undefined'
+
+
+def same_const(a, b) -> bool:
+    '''
+    Constants are equal if they have the same type and value. `repr` tells -0.0 from 0.0 (and nan is equal to itself).
+    '''
+    return type(a) is type(b) and repr(a) == repr(b)
+
+
+def meet(a, b):
+    if a is TOP:
+        return b
+    if b is TOP:
+        return a
+    if a is BOTTOM or b is BOTTOM or not same_const(a, b):
+        return BOTTOM
+    return a
+
+
+def lattice_equal(a, b) -> bool:
+    if is_const(a) and is_const(b):
+        return same_const(a, b)
+    return a is b
+
+
+def evaluate(op: str, args: list):
+    '''
+    The value of `op` on lattice values `args`. Return TOP, BOTTOM or a constant.
+    '''
+    # a known false / true decides `and` / `or` whatever the other arg is
+    if op == 'and' and any(arg is False for arg in args):
+        return False
+    if op == 'or' and any(arg is True for arg in args):
+        return True
+    if op not in FOLDABLE_OPS: # call, load, alloc, ...
+        return BOTTOM
+    if any(arg is BOTTOM for arg in args):
+        return BOTTOM
+    if any(arg is TOP for arg in args):
+        return TOP
+    result = eval_const(op, args) # the same folding as lvn.py
+    if result is None: # division by zero, inf or nan: left for run time
+        return BOTTOM
+    return result
+
+
+def sccp(func, am: AnalysisManager = None) -> dict:
+    '''
+    Sparse Conditional Constant Propagation of an SSA-form function. The function is rewritten:
+        - instructions (and phis) whose value is a constant become `const`.
+        - a `br` whose condition is a constant becomes a `jmp`.
+        - blocks that are never executed are deleted, and so are the phi args coming from them.
+
+    Data structures:
+        value: dict. Key: variable; Value: TOP, BOTTOM or a constant.
+        uses: dict. Key: variable; Value: list of (label, instr) that read it.
+        executable: set of labels of the blocks that can be executed.
+        edges: set of (pred label, succ label) CFG edges that can be executed.
+
+    Return: dict of stats. `folded`: instructions turned into const; `branches`: br turned into jmp; `blocks`: deleted blocks.
+    '''
+    if am is None:
+        am = AnalysisManager()
+    cfg = am.get('cfg', func)
+    blocks = cfg.blocks
+
+    value = dict()
+    uses = dict()
+    for func_arg in func.get('args', []):
+        value[func_arg['name']] = BOTTOM
+    for label, block in blocks.items():
+        for instr in block:
+            if 'dest' in instr:
+                value[instr['dest']] = TOP
+            for arg in instr.get('args', []):
+                uses.setdefault(arg, list()).append((label, instr))
+
+    def get(var):
+        if var == UNDEFINED:
+            return TOP # undefined on that path: any value will do
+        return value.get(var, BOTTOM)
+
+    executable = set()
+    edges = set()
+    stuck = set() # blocks whose `br` condition was still TOP once everything else converged: both edges are taken
+    flow_worklist = [(None, cfg.entry)]
+    ssa_worklist = list()
+
+    def set_value(var, new):
+        if not lattice_equal(new, value[var]):
+            value[var] = new
+            ssa_worklist.append(var)
+
+    def visit_phi(label, instr):
+        new = TOP
+        for phi_label, arg in zip(instr['labels'], instr['args']):
+            if (phi_label, label) in edges:
+                new = meet(new, get(arg))
+        set_value(instr['dest'], new)
+
+    def visit(label, instr):
+        op = instr['op']
+        if op == 'phi':
+            visit_phi(label, instr)
+        elif op == 'br':
+            cond = get(instr['args'][0])
+            if cond is BOTTOM or (cond is TOP and label in stuck):
+                targets = instr['labels']
+            elif cond is TOP:
+                targets = []
+            else:
+                targets = [instr['labels'][0] if cond else instr['labels'][1]]
+            for target in targets:
+                flow_worklist.append((label, target))
+        elif op == 'jmp':
+            flow_worklist.append((label, instr['labels'][0]))
+        elif 'dest' in instr:
+            if op == 'const':
+                set_value(instr['dest'], instr['value'])
+            elif op == 'id':
+                set_value(instr['dest'], get(instr['args'][0]))
+            else:
+                set_value(instr['dest'], evaluate(op, [get(arg) for arg in instr.get('args', [])]))
+
+    while True:
+        while flow_worklist or ssa_worklist:
+            while flow_worklist:
+                edge = flow_worklist.pop()
+                if edge in edges:
+                    continue
+                edges.add(edge)
+                label = edge[1]
+                if label in executable: # already visited: only the phis can see the new edge
+                    for instr in blocks[label]:
+                        if instr.get('op', None) == 'phi':
+                            visit_phi(label, instr)
+                else:
+                    executable.add(label)
+                    for instr in blocks[label]:
+                        if 'op' in instr:
+                            visit(label, instr)
+            while ssa_worklist:
+                var = ssa_worklist.pop()
+                for label, instr in uses.get(var, []):
+                    if label in executable:
+                        visit(label, instr)
+
+        # A `br` on a condition that is still TOP (only defined in blocks that are never executed) has no executable
+        # edge yet. Nothing can make it a constant any more: count it as BOTTOM, so both targets are kept.
+        new_stuck = [label for label in executable if label not in stuck and blocks[label][-1].get('op', None) == 'br'
+                     and get(blocks[label][-1]['args'][0]) is TOP]
+        if not new_stuck:
+            break
+        for label in new_stuck:
+            stuck.add(label)
+            visit(label, blocks[label][-1])
+
+    # rewrite the function
+    stats = {'folded': 0, 'branches': 0, 'blocks': 0}
+    kept = list()
+    for label, block in blocks.items():
+        if label not in executable:
+            stats['blocks'] += 1
+            continue
+        for instr in block:
+            op = instr.get('op', None)
+            if op == 'phi': # drop the args coming along edges that are never executed
+                pairs = [(l, arg) for l, arg in zip(instr['labels'], instr['args']) if (l, label) in edges]
+                instr['labels'] = [l for l, _ in pairs]
+                instr['args'] = [arg for _, arg in pairs]
+            if 'dest' in instr and op != 'const' and is_const(get(instr['dest'])):
+                instr.update({'op': 'const', 'value': get(instr['dest'])})
+                instr.pop('args', None)
+                instr.pop('labels', None)
+                stats['folded'] += 1
+            elif op == 'br':
+                targets = [target for target in instr['labels'] if (label, target) in edges]
+                if len(set(targets)) == 1:
+                    instr.update({'op': 'jmp', 'labels': targets[:1]})
+                    instr.pop('args', None)
+                    stats['branches'] += 1
+        kept.append(block)
+
+    func['instrs'] = flatten(kept)
+    return stats
+
+
+if __name__ == "__main__":
+    stats = '-s' in sys.argv # print what was rewritten
+
+    prog = json.load(sys.stdin)
+    for func in prog['functions']:
+        func_stats = sccp(func)
+        if stats:
+            print(f"{func['name']}: folded {func_stats['folded']}, branches {func_stats['branches']}, removed blocks {func_stats['blocks']}", file=sys.stderr)
+
+    print(json.dumps(prog, indent=2, sort_keys=True))
@@ -2,9 +2,12 @@ from collections import OrderedDict, namedtuple
 import json
 import sys
 
-from utils import form_blocks, flatten, fresh
-from cfg import block_map, add_entry, add_terminators, get_succ, get_pred
-from dom import find_dom, get_dom_tree, get_dom_frontier
+from utils import flatten, SymbolTable
+from cfg import CFG
+from manager import AnalysisManager, CFG_ANALYSES
+
+# to_ssa only inserts phi nodes and renames variables: the blocks and the edges between them stay the same. 
+PRESERVES = ('symbols',) + CFG_ANALYSES
 
 # def_blocks: list. A list of block names that define this var. e.g. ['entry', 'left', 'right']
 # type: str. The data type of a variable. e.g. "int"
@@ -50,7 +53,7 @@ def get_var_infos(blocks: OrderedDict, func_args: list) -> dict:
 
     return var_infos
 
-def insert_phi_nodes(blocks: OrderedDict, var_infos: dict, DF: dict, cfg_pred: dict):
+def insert_phi_nodes(blocks: OrderedDict, var_infos: dict, DF: dict, cfg: CFG):
     '''
     Step 1: Insert Phi Nodes into blocks. 
     e.g. `print a` -> `a: int = phi a .left a .right` + `print a`
@@ -82,7 +85,7 @@ def insert_phi_nodes(blocks: OrderedDict, var_infos: dict, DF: dict, cfg_pred: d
         for def_block in var_info.def_blocks: # blocks where var_name is assigned      
             for block in DF[def_block]: # Dominance frontier
                 if var_name not in phi_node_var_block[block]: # first time to add the phi node of `var_name` in this block
-                    phi_node = add_phi_node(var_name, var_info, cfg_pred[block])
+                    phi_node = add_phi_node(var_name, var_info, cfg.pred[block])
                     phi_node_var_block[block][var_name] = phi_node           
 
                     # add block to defs[v] unless it's already in there
@@ -96,12 +99,13 @@ def insert_phi_nodes(blocks: OrderedDict, var_infos: dict, DF: dict, cfg_pred: d
 
 
 
-def rename_vars(blocks: OrderedDict, var_infos: dict, cfg_succ: dict, dom_tree: dict, func_args: list):
+def rename_vars(blocks: OrderedDict, var_infos: dict, cfg: CFG, dom_tree: dict, func_args: list, symbols: SymbolTable):
     '''
     Step 2: rename variables. Basically we need to walk the Dominance-Tree and renaming variables as you go. Replace uses with more recent renamed def. 
     
     It's easier to understand with an example. Recursive call rename_vars(), so we are actually visiting the Dominance-Tree by Pre-Order. 
 
+    New names come from `symbols` (the SymbolTable of the function), so each one is generated in O(1). 
     '''
     if DEBUG:
         print(f"dom_tree: {dom_tree}")
@@ -115,9 +119,6 @@ def rename_vars(blocks: OrderedDict, var_infos: dict, cfg_succ: dict, dom_tree:
         func_arg_name = func_arg['name']
         stack[func_arg_name].append(func_arg_name)
 
-    # dict(str: list). Key: var; Value: a list containing all of the used names for this variables. This dict is recorded for generating fresh new name each time. 
-    var_names = {var: list() for var in var_infos.keys()} 
-
     def rename(block_tuple: tuple): # block[0]: name; block[1]: block (list of instrs)
         '''
         rename function targeted at one block. This function is called recursively. 
@@ -145,7 +146,7 @@ def rename_vars(blocks: OrderedDict, var_infos: dict, cfg_succ: dict, dom_tree:
             # replace instr's destination with a new name
             if 'dest' in instr:
                 dest_var = instr['dest']
-                dest_new = fresh(dest_var, var_names[dest_var])
+                dest_new = symbols.vars.fresh(dest_var)
                 instr['dest'] = dest_new
                 # push that new name onto stack[old name]
                 stack[dest_var].append(dest_new)
@@ -154,7 +155,7 @@ def rename_vars(blocks: OrderedDict, var_infos: dict, cfg_succ: dict, dom_tree:
                 if DEBUG:
                     print(f"[{name}] dest_new: {dest_new}, dest_old: {dest_var}")
             
-        for succ in cfg_succ[name]:
+        for succ in cfg.succ[name]:
             for idx, instr in enumerate(blocks[succ]): # for p in succ's Phi-Nodes
                 if instr.get('op', None) == 'phi':
                     pred_idx = instr['labels'].index(name) # get the index of predecessor in instr['labels']. It should be the same order with instr['args]
@@ -185,37 +186,40 @@ def rename_vars(blocks: OrderedDict, var_infos: dict, cfg_succ: dict, dom_tree:
     rename(entry_block)
     
 
-def to_ssa(func):
+def to_ssa(func, am: AnalysisManager = None):
+    '''
+    Transform `func` into SSA form. CFG, dominance analysis and the symbol table come from `am` (a fresh AnalysisManager if not given), 
+    so they are shared with the other passes of a pipeline. 
+    '''
+    if am is None:
+        am = AnalysisManager()
+
     # function input args
     func_args = func.get('args', [])
 
-    blocks = block_map(list(form_blocks(func['instrs'])))
+    symbols = am.get('symbols', func)
 
-    add_entry(blocks)
-    add_terminators(blocks)
-    # add terminators? Maybe some bugs are due to this. Currently I don't add terminators manually. 
+    # the blocks already have a unique entry and a terminator each (see manager.compute_cfg)
+    cfg = am.get('cfg', func)
+    blocks = cfg.blocks
 
     if DEBUG:
         print(f"Blocks: \n{blocks}")
 
-    cfg_succ = get_succ(blocks)
-    cfg_pred = get_pred(blocks)
-
     # Dominance Analysis
-    dom = find_dom(cfg_pred)
-    dom_tree = get_dom_tree(dom)
-    DF = get_dom_frontier(dom, cfg_succ)
+    dom_tree = am.get('dom_tree', func)
+    DF = am.get('frontier', func)
 
     var_infos = get_var_infos(blocks, func_args)
 
     # Step 1: insert phi nodes
-    insert_phi_nodes(blocks, var_infos, DF, cfg_pred)
+    insert_phi_nodes(blocks, var_infos, DF, cfg)
 
     if DEBUG:
         print(f"After Step 1: \nblocks: {blocks}\n")
 
     # Step 2: rename variables
-    rename_vars(blocks, var_infos, cfg_succ, dom_tree, func_args)
+    rename_vars(blocks, var_infos, cfg, dom_tree, func_args, symbols)
 
 
     # Assemble instructions
@@ -7,16 +7,79 @@ def flatten(ll):
     """
     return list(itertools.chain(*ll))
 
-def fresh(seed, names):
-    '''Generate a new name that is not in `names` starting with `seed`.
+
+class Names:
+    '''Intern table for one namespace (variables or labels). 
+    Maps names to dense integer ids and back, and generates fresh names. 
     '''
-    i = 0
-    while True:
+    def __init__(self):
+        self.ids = dict() # name -> id
+        self.names = list() # id -> name
+        self.counters = dict() # seed -> next suffix to try
+
+    def intern(self, name: str) -> int:
+        '''Return the id of `name`, adding it to the table if it is new.
+        '''
+        id = self.ids.get(name)
+        if id is None:
+            id = len(self.names)
+            self.ids[name] = id
+            self.names.append(name)
+        return id
+
+    def fresh(self, seed: str) -> str:
+        '''Generate a new name `seed.N` that is not in the table yet, and intern it. 
+        Every seed has its own counter, so this is O(1) amortized instead of a scan over all used names. 
+        '''
+        i = self.counters.get(seed, 0)
         name = seed + '.' + str(i)
-        if name not in names:
-            names.append(name)
-            return name
-        i += 1
+        while name in self.ids: # only skips names that were already in the program
+            i += 1
+            name = seed + '.' + str(i)
+        self.counters[seed] = i + 1
+        self.intern(name)
+        return name
+
+    def __getitem__(self, id: int) -> str:
+        return self.names[id]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def __len__(self):
+        return len(self.names)
+
+
+class SymbolTable:
+    '''Per-function symbol table: variables and labels interned to integer ids. 
+    Build it once per function and hand it to every pass that needs fresh names; 
+    names only need to be turned back into strings when the program is emitted. 
+    '''
+    def __init__(self):
+        self.vars = Names()
+        self.labels = Names()
+
+    @classmethod
+    def from_func(cls, func: dict):
+        '''Collect every variable and label name used in `func`.
+        '''
+        symbols = cls()
+        for func_arg in func.get('args', []):
+            symbols.vars.intern(func_arg['name'])
+        symbols.add_instrs(func['instrs'])
+        return symbols
+
+    def add_instrs(self, instrs):
+        for instr in instrs:
+            if 'label' in instr:
+                self.labels.intern(instr['label'])
+                continue
+            if 'dest' in instr:
+                self.vars.intern(instr['dest'])
+            for arg in instr.get('args', []):
+                self.vars.intern(arg)
+            for label in instr.get('labels', []):
+                self.labels.intern(label)
 
 # Instructions that terminate a basic block.
 TERMINATORS = 'br', 'jmp', 'ret'